@@ -7,20 +7,39 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from dishka import make_async_container
 from dishka.integrations.fastapi import setup_dishka
 
 from app import __version__
 from app.core.config import settings
+from app.core.executor import image_executor
 from app.core.ioc import AdaptersProvider, InteractorProvider
-from app.routers import api_router
+from app.routers import api_router, avatars_router
+from app.services.geo_index import geo_index, keep_geo_index_fresh, refresh_geo_index
+from app.services.redis import listen_invalidations, local_cache
+from app.services.storage import get_avatar_storage
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    image_executor.start()
+    invalidations = asyncio.create_task(listen_invalidations()) if local_cache is not None else None
+    geo_refresh = None
+    if geo_index is not None:
+        # The first load reads every located user, it runs before serving instead of inside the first request
+        await refresh_geo_index()
+        geo_refresh = asyncio.create_task(keep_geo_index_fresh())
     yield
+    for task in (invalidations, geo_refresh):
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    await image_executor.shutdown()
+    await get_avatar_storage().close()
     await app.state.dishka_container.close()
 
 
@@ -35,6 +54,7 @@ app.add_middleware(
 )
 
 app.include_router(api_router, prefix=settings.BASE_PATH_PREFIX)
+app.include_router(avatars_router)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 container = make_async_container(AdaptersProvider(), InteractorProvider())
@@ -54,7 +74,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     content = jsonable_encoder(
         {"error": exc.detail.get("error"), "error_description": exc.detail.get("error_description")}
     )
-    return JSONResponse(status_code=exc.status_code, content=content)
+    return JSONResponse(status_code=exc.status_code, content=content, headers=exc.headers)
 
 
 @app.get("/specs", include_in_schema=False)
@@ -73,3 +93,11 @@ async def openapi(req: Request) -> JSONResponse:
         routes=app.routes,
     )
     return JSONResponse(openapi)
+
+
+# Unauthenticated, so only exposed on local setups
+if settings.ENVIRONMENT == "local":
+
+    @app.get("/cache/stats", include_in_schema=False)
+    async def cache_stats() -> JSONResponse:
+        return JSONResponse({"local": local_cache.stats() if local_cache is not None else None})
@@ -52,12 +52,92 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: str | None = None
     REDIS_DB: int = 0
     REDIS_TTL: int = 60 * 60
+    LIST_TOTAL_TTL: int = 5 * 60
+    # After the soft TTL a cached /list page or total is refreshed by one request while others get the old value
+    LIST_SOFT_TTL: int = 60
+    LIST_TOTAL_SOFT_TTL: int = 60
+    CACHE_FILL_LOCK_TIMEOUT: float = 10.0
+    CACHE_FILL_WAIT_INTERVAL: float = 0.05
+    # Radius queries are cached per grid cell of the viewer and measured from the cell centre,
+    # the cell side is this fraction of the radius so the offset stays within a few percent of it
+    LIST_CACHE_CELL_FRACTION: float = 0.05
+    # Per-process tier in front of Redis, kept coherent across processes over pub/sub
+    LOCAL_CACHE_ENABLED: bool = False
+    LOCAL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    LOCAL_CACHE_MAX_ITEMS: int = 10_000
+    LOCAL_CACHE_TTL: float = 5.0
+    CACHE_INVALIDATION_CHANNEL: str = "cache:invalidate"
+    # Likes per user per local calendar day
+    MATCH_DAILY_LIMIT: int = 15
+    MATCH_BATCH_MAX: int = 50
+    # A deleted or edited user keeps authenticating with the cached snapshot for at most this many seconds
+    PRINCIPAL_CACHE_TTL: int = 10 * 60
+    TOKEN_MEMO_MAX_ITEMS: int = 10_000
 
     @computed_field
     @property
     def REDIS_URL(self) -> str:
         return f"redis://:{self.REDIS_PASSWORD}@{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
 
+    AVATAR_MAX_SIZE: int = 10 * 1024 * 1024
+    AVATAR_MAX_PIXELS: int = 40_000_000
+    # Local scratch space for uploads being validated or processed, None means the system temporary directory
+    AVATAR_UPLOAD_DIR: str | None = None
+
+    AVATAR_STORAGE: Literal["local", "s3"] = "local"
+    AVATAR_STORAGE_PATH: str = "static"
+    S3_BUCKET: str = "avatars"
+    S3_ENDPOINT_URL: str | None = None
+    S3_REGION: str | None = None
+    S3_ACCESS_KEY_ID: str | None = None
+    S3_SECRET_ACCESS_KEY: str | None = None
+    S3_PART_SIZE: int = 8 * 1024 * 1024
+    # Local storage only: uploads wait here for the worker, outside the public static root,
+    # None means a directory inside the system temporary directory
+    AVATAR_STAGING_PATH: str | None = None
+
+    AVATAR_RENDER_MAX_SIZE: int = 2048
+    AVATAR_RENDER_CACHE_MEMORY: int = 64 * 1024 * 1024
+    AVATAR_RENDER_CACHE_DISK: int = 512 * 1024 * 1024
+    # None means a directory inside the system temporary directory
+    AVATAR_RENDER_CACHE_PATH: str | None = None
+
+    # Password hashing runs in its own threads, callers beyond the queue get 503 instead of waiting
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_WORKERS: int = 4
+    BCRYPT_QUEUE_SIZE: int = 64
+    BCRYPT_QUEUE_TIMEOUT: float = 2.0
+    IMAGE_WORKERS: int = 2
+    IMAGE_QUEUE_SIZE: int = 32
+    # watermark width as a fraction of the avatar shorter side
+    WATERMARK_SCALE: float = 0.25
+    # shorter sides the watermark is prescaled for, other sizes are resized from the next bucket up
+    WATERMARK_BUCKETS: list[int] = [256, 512, 1024, 2048, 4096]
+    WATERMARK_CACHE_SIZE: int = 8
+
+    JOB_QUEUE_NAME: str = "jobs"
+    JOB_QUEUE_MAX_LENGTH: int = 10_000
+    JOB_VISIBILITY_TIMEOUT: int = 60
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BACKOFF: float = 2.0
+    JOB_RETRY_BACKOFF_MAX: float = 5 * 60
+    JOB_POLL_INTERVAL: float = 0.5
+    WORKER_CONCURRENCY: int = 8
+    AVATAR_UPDATE_BATCH_SIZE: int = 50
+    AVATAR_UPDATE_BATCH_DELAY: float = 0.5
+
+    # In-process numpy index for /list radius queries, requires the optional `numpy` dependency
+    GEO_INDEX_ENABLED: bool = False
+    GEO_INDEX_CELL_DEGREES: float = 1.0
+    GEO_INDEX_REFRESH_SECONDS: float = 5.0
+    GEO_INDEX_MAX_TAIL: int = 4096
+
+    # Likes are recorded in Redis sets and written to Postgres by the worker, rebuild with `--rebuild-likes`
+    LIKE_GRAPH_ENABLED: bool = False
+    LIKE_GRAPH_FLUSH_BATCH_SIZE: int = 500
+    LIKE_GRAPH_FLUSH_INTERVAL: float = 1.0
+    LIKE_GRAPH_FLUSH_LOCK_TIMEOUT: float = 30.0
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -1,11 +1,13 @@
 from abc import abstractmethod
 from typing import Protocol
 
+from sqlalchemy import ClauseElement, Executable
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.ext.compiler import compiles
 
 from app.core.config import settings
 
@@ -21,6 +23,20 @@ AsyncSessionFactory = async_sessionmaker(
 )
 
 
+class Explain(Executable, ClauseElement):
+    """`EXPLAIN (FORMAT JSON)` of a statement, keeping its bound parameters."""
+
+    inherit_cache = False
+
+    def __init__(self, statement: Executable) -> None:
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kw) -> str:
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kw)}"
+
+
 class BaseDbConnection(Protocol):
     @abstractmethod
     def commit(self) -> None:
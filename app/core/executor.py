@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import ParamSpec, TypeVar
+
+from app.core.config import settings
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+class ImageExecutor:
+    """Process pool for CPU-bound image work with a bounded number of pending jobs."""
+
+    def __init__(self, max_workers: int, max_queue: int) -> None:
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self._pool: ProcessPoolExecutor | None = None
+        self._initializer: Callable[[], object] | None = None
+        self._slots = asyncio.Semaphore(self.capacity)
+        self._pending = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self._pending >= self.capacity
+
+    def start(self, initializer: Callable[[], object] | None = None) -> None:
+        if self._pool is None:
+            self._initializer = initializer
+            self._pool = self._create_pool()
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self._initializer,
+        )
+
+    async def shutdown(self) -> None:
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        await asyncio.to_thread(pool.shutdown, wait=True)
+
+    async def run(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        if self._pool is None:
+            raise RuntimeError("Image executor is not started")
+        self._pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                pool = self._pool
+                try:
+                    return await loop.run_in_executor(pool, _call, func, args, kwargs)
+                except BrokenProcessPool:
+                    self._replace(pool)
+                    raise
+        finally:
+            self._pending -= 1
+
+    def _replace(self, broken: ProcessPoolExecutor) -> None:
+        """Swap in a fresh pool once a child died, e.g. killed for memory, the calls running on it fail."""
+        if self._pool is not broken:
+            # Another call that ran on the same pool already replaced it
+            return
+        logging.error("Image worker process died, restarting the pool")
+        self._pool = self._create_pool()
+        broken.shutdown(wait=False)
+
+
+class ExecutorSaturated(Exception):
+    """The executor could not take the call within its queue limits."""
+
+
+class PasswordExecutor:
+    """Thread pool for bcrypt, which releases the GIL, with a cap on running and waiting calls."""
+
+    def __init__(self, max_workers: int, max_queue: int, queue_timeout: float) -> None:
+        self.capacity = max_workers + max_queue
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(max_workers)
+        self._pending = 0
+
+    async def run(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        if self._pending >= self.capacity:
+            raise ExecutorSaturated
+        self._pending += 1
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except TimeoutError:
+                raise ExecutorSaturated from None
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, _call, func, args, kwargs)
+            finally:
+                self._slots.release()
+        finally:
+            self._pending -= 1
+
+
+def _call(func: Callable[..., R], args: tuple, kwargs: dict) -> R:
+    return func(*args, **kwargs)
+
+
+image_executor = ImageExecutor(max_workers=settings.IMAGE_WORKERS, max_queue=settings.IMAGE_QUEUE_SIZE)
+password_executor = PasswordExecutor(
+    max_workers=settings.BCRYPT_WORKERS,
+    max_queue=settings.BCRYPT_QUEUE_SIZE,
+    queue_timeout=settings.BCRYPT_QUEUE_TIMEOUT,
+)
@@ -5,7 +5,15 @@ from redis.asyncio import Redis
 
 from app.core.config import settings
 from app.core.db import AsyncSessionFactory, DbConnection
-from app.services import AuthService, EmailService, RedisService, SecurityService
+from app.services import (
+    AuthService,
+    EmailService,
+    JobQueue,
+    LikeGraph,
+    RateLimiter,
+    RedisService,
+    SecurityService,
+)
 
 
 class AdaptersProvider(Provider):
@@ -32,3 +40,6 @@ class InteractorProvider(Provider):
     auth = provide(AuthService)
     email = provide(EmailService)
     redis_service = provide(RedisService)
+    jobs = provide(JobQueue)
+    rate_limiter = provide(RateLimiter)
+    like_graph = provide(LikeGraph)
@@ -1,35 +1,122 @@
-from sqlalchemy import and_, delete, select, update
+from collections.abc import Sequence
+
+from sqlalchemy import Integer, Row, column, delete, exists, false, func, literal, select, update, values
+from sqlalchemy.dialects.postgresql import insert
 
 from app.core.db import DbConnection
 from app.daos.base import BaseDao
 from app.models.coincidences import Coincidence
+from app.models.user import User
 
 
 class CoincidenceDao(BaseDao):
     def __init__(self, db_connection: DbConnection) -> None:
         self.session = db_connection.session
 
-    async def create(self, match_data: dict[str, int]) -> bool:
-        statement = select(Coincidence).where(
-            and_(
-                Coincidence.first_user_id == match_data["match_id"], Coincidence.second_user_id == match_data["user_id"]
+    async def create(self, match_data: dict[str, int]) -> Row | None:
+        """Record that user_id likes match_id, returns email and first_name of match_id when the like is mutual.
+
+        The insert, the reciprocity check and the lookup of the other user are one statement. It runs after taking
+        the lock of the pair, so of two users liking each other at once the second one sees the first one's row.
+        """
+        user_id, match_id = match_data["user_id"], match_data["match_id"]
+        liked = (
+            insert(Coincidence)
+            .values(first_user_id=user_id, second_user_id=match_id, compared=False)
+            .on_conflict_do_nothing(index_elements=[Coincidence.first_user_id, Coincidence.second_user_id])
+            .returning(Coincidence.id)
+            .cte("liked")
+        )
+        # Only the first like of the pair can complete a match, repeated likes leave it alone
+        matched = (
+            update(Coincidence)
+            .where(
+                Coincidence.first_user_id == match_id,
+                Coincidence.second_user_id == user_id,
+                Coincidence.compared == false(),
+                exists(select(liked.c.id)),
             )
+            .values(compared=True)
+            .returning(Coincidence.first_user_id)
+            .cte("matched")
         )
-        coincidence = await self.session.scalar(statement=statement)
-        if coincidence and coincidence.compared:
-            return False
-        elif coincidence and not coincidence.compared:
-            statement = update(Coincidence).where(Coincidence.id == coincidence.id).values(compared=True)
-            await self.session.execute(statement=statement)
-            await self.session.commit()
-            return True
+        statement = select(User.email, User.first_name).join(matched, User.id == matched.c.first_user_id)
+        rows = await self._execute_locked(user_id, [match_id], statement)
+        return rows[0] if rows else None
+
+    async def create_batch(self, user_id: int, match_ids: list[int]) -> Sequence[Row]:
+        """Record that user_id likes every one of match_ids, returns id, email and first_name of mutual matches.
+
+        Same statement as `create` for a set of users at once.
+        """
+        targets = values(column("id", Integer), name="targets").data([(match_id,) for match_id in match_ids])
+        liked = (
+            insert(Coincidence)
+            .from_select(
+                ["first_user_id", "second_user_id", "compared"],
+                select(literal(user_id, Integer), targets.c.id, false()),
+            )
+            .on_conflict_do_nothing(index_elements=[Coincidence.first_user_id, Coincidence.second_user_id])
+            .returning(Coincidence.second_user_id)
+            .cte("liked")
+        )
+        matched = (
+            update(Coincidence)
+            .where(
+                Coincidence.first_user_id.in_(select(liked.c.second_user_id)),
+                Coincidence.second_user_id == user_id,
+                Coincidence.compared == false(),
+            )
+            .values(compared=True)
+            .returning(Coincidence.first_user_id)
+            .cte("matched")
+        )
+        statement = select(User.id, User.email, User.first_name).join(matched, User.id == matched.c.first_user_id)
+        return await self._execute_locked(user_id, match_ids, statement)
+
+    async def _execute_locked(self, user_id: int, match_ids: list[int], statement) -> Sequence[Row]:
+        """Run `statement` while holding the transaction-level advisory lock of every pair of user_id and match_ids.
+
+        The locks are taken by a statement of their own: under READ COMMITTED each statement sees the rows committed
+        before it started, which for a statement waiting on a lock would miss the row of the transaction holding it.
+        """
+        # Pairs are locked in one global order, so batches that share pairs cannot deadlock
+        pairs = sorted({(min(user_id, match_id), max(user_id, match_id)) for match_id in match_ids})
+        locks = values(column("low", Integer), column("high", Integer), name="pairs").data(pairs)
+        ordered = select(locks.c.low, locks.c.high).order_by(locks.c.low, locks.c.high).subquery()
+        await self.session.execute(select(func.pg_advisory_xact_lock(ordered.c.low, ordered.c.high)))
+        result = await self.session.execute(statement=statement)
+        rows = result.all()
+        await self.session.commit()
+        return rows
 
-        _coincidence = Coincidence(
-            first_user_id=match_data["user_id"], second_user_id=match_data["match_id"], compared=False
+    async def create_many(self, likes: list[tuple[int, int]], matches: list[tuple[int, int]]) -> None:
+        """Store (first_user_id, second_user_id) likes and mark the liked-back `matches` rows as compared."""
+        statement = (
+            insert(Coincidence)
+            .values(
+                [
+                    {"first_user_id": first_user_id, "second_user_id": second_user_id, "compared": False}
+                    for first_user_id, second_user_id in dict.fromkeys(likes)
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=[Coincidence.first_user_id, Coincidence.second_user_id])
         )
-        self.session.add(_coincidence)
+        await self.session.execute(statement=statement)
+        if matches:
+            rows = values(column("first_user_id", Integer), column("second_user_id", Integer), name="matches").data(
+                matches
+            )
+            statement = (
+                update(Coincidence)
+                .where(
+                    Coincidence.first_user_id == rows.c.first_user_id,
+                    Coincidence.second_user_id == rows.c.second_user_id,
+                )
+                .values(compared=True)
+            )
+            await self.session.execute(statement=statement)
         await self.session.commit()
-        return False
 
     async def get_by_id(self, coincidence_id: int) -> Coincidence | None:
         statement = select(Coincidence).where(Coincidence.id == coincidence_id)
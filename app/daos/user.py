@@ -1,9 +1,50 @@
-from sqlalchemy import delete, select
+import json
+from collections.abc import Sequence
+from datetime import datetime
 
-from app.core.db import DbConnection
+from sqlalchemy import (
+    Integer,
+    Row,
+    String,
+    asc,
+    column,
+    delete,
+    desc,
+    false,
+    func,
+    null,
+    select,
+    tuple_,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
+from app.core.db import DbConnection, Explain
 from app.daos.base import BaseDao
 from app.models.user import User
-from app.schemas.user import UserIn
+from app.schemas.user import UserIn, UserListFilter, UserSortBy
+from app.utils.geo import bounding_box_filter, haversine_distance
+
+# Columns exposed by UserOut plus created_at for keyset cursors, the password hash is never loaded for listings
+USER_OUT_COLUMNS = (
+    User.id,
+    User.email,
+    User.first_name,
+    User.last_name,
+    User.gender,
+    User.latitude,
+    User.longitude,
+    User.avatar,
+    User.avatar_variants,
+    User.created_at,
+)
+
+
+def _contains(value: str) -> str:
+    """ILIKE pattern for `value` anywhere in the column, its `%` and `_` match literally as in the geo index."""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
 
 
 class UserDao(BaseDao):
@@ -19,6 +60,14 @@ class UserDao(BaseDao):
         await self.session.refresh(_user)
         return _user
 
+    async def create_if_absent(self, user_data: UserIn) -> User | None:
+        """Insert the user in one statement, None when the email is already registered."""
+        _data = user_data.model_dump(include=set(self.columns))
+        statement = insert(User).values(**_data).on_conflict_do_nothing(index_elements=[User.email]).returning(User)
+        _user = await self.session.scalar(statement=statement)
+        await self.session.commit()
+        return _user
+
     async def get_by_id(self, user_id: int) -> User | None:
         statement = select(User).where(User.id == user_id)
         return await self.session.scalar(statement=statement)
@@ -27,6 +76,95 @@ class UserDao(BaseDao):
         statement = select(User).where(User.email == email)
         return await self.session.scalar(statement=statement)
 
+    async def update_password(self, user_id: int, password: str) -> None:
+        statement = update(User).where(User.id == user_id).values(password=password)
+        await self.session.execute(statement=statement)
+        await self.session.commit()
+
+    async def update_avatars(self, avatars: dict[int, dict[str, dict[str, str]]]) -> None:
+        rows = values(
+            column("id", Integer), column("avatar", String), column("avatar_variants", JSONB), name="avatars"
+        ).data([(user_id, variants["full"]["jpeg"], variants) for user_id, variants in avatars.items()])
+        statement = (
+            update(User)
+            .where(User.id == rows.c.id)
+            .values(avatar=rows.c.avatar, avatar_variants=rows.c.avatar_variants)
+        )
+        await self.session.execute(statement=statement)
+        await self.session.commit()
+
+    def _filtered(self, filters: UserListFilter, latitude: float | None, longitude: float | None):
+        """Select of users matching `filters` and the distance expression (NULL without a radius)."""
+        distance = null()
+        query = select(User)
+
+        if filters.gender:
+            query = query.filter(User.gender == filters.gender.value)
+        if filters.first_name:
+            query = query.filter(User.first_name.ilike(_contains(filters.first_name), escape="\\"))
+        if filters.last_name:
+            query = query.filter(User.last_name.ilike(_contains(filters.last_name), escape="\\"))
+
+        if filters.radius_km:
+            if latitude is None or longitude is None:
+                query = query.filter(false())
+            else:
+                # The indexed bounding box cuts candidates down before the exact great-circle check
+                distance = haversine_distance(User.latitude, User.longitude, latitude, longitude)
+                query = query.filter(
+                    bounding_box_filter(User.latitude, User.longitude, latitude, longitude, filters.radius_km),
+                    distance <= filters.radius_km,
+                )
+        return query, distance
+
+    async def search(
+        self,
+        filters: UserListFilter,
+        latitude: float | None,
+        longitude: float | None,
+        limit: int,
+        offset: int,
+        after: tuple[datetime | float, int] | None = None,
+    ) -> Sequence[Row]:
+        """Page of USER_OUT_COLUMNS rows with `distance_km` from (latitude, longitude) when a radius is given.
+
+        `after` is the (sort value, id) keyset of the last row already seen, the page then starts right after it.
+        """
+        query, distance = self._filtered(filters, latitude, longitude)
+
+        if filters.sort_by == UserSortBy.distance and filters.radius_km:
+            # ORDER BY ... LIMIT lets Postgres keep a bounded top-N heap instead of sorting every match
+            keyset, direction = (distance, User.id), asc
+        else:
+            keyset, direction = (User.created_at, User.id), desc if filters.order == "desc" else asc
+        if after is not None:
+            if direction is asc:
+                query = query.filter(tuple_(*keyset) > tuple_(*after))
+            else:
+                query = query.filter(tuple_(*keyset) < tuple_(*after))
+        query = query.order_by(*(direction(column) for column in keyset))
+
+        query = query.with_only_columns(*USER_OUT_COLUMNS, distance.label("distance_km")).limit(limit).offset(offset)
+        result = await self.session.execute(query)
+        return result.all()
+
+    async def get_out_rows(self, user_ids: list[int]) -> Sequence[Row]:
+        statement = select(*USER_OUT_COLUMNS).where(User.id.in_(user_ids))
+        result = await self.session.execute(statement=statement)
+        return result.all()
+
+    async def count(
+        self, filters: UserListFilter, latitude: float | None, longitude: float | None, approximate: bool = False
+    ) -> int:
+        """Number of users matching `filters`, or the planner row estimate when `approximate` is set."""
+        query, _ = self._filtered(filters, latitude, longitude)
+        if approximate:
+            plan = await self.session.scalar(Explain(query.with_only_columns(User.id)))
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        return await self.session.scalar(select(func.count()).select_from(query.with_only_columns(User.id).subquery()))
+
     async def get_all(self) -> list[User]:
         statement = select(User).order_by(User.id)
         result = await self.session.execute(statement=statement)
@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base, intpk
@@ -5,6 +6,10 @@ from app.models.base import Base, intpk
 
 class Coincidence(Base):
     __tablename__ = "coincidences"
+    __table_args__ = (
+        Index("ix__coincidences_first_user_id_second_user_id", "first_user_id", "second_user_id", unique=True),
+        Index("ix__coincidences_second_user_id_first_user_id", "second_user_id", "first_user_id"),
+    )
 
     id: Mapped[intpk]
     first_user_id: Mapped[int] = mapped_column(nullable=False)
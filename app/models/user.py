@@ -1,7 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import String, func
-from sqlalchemy.dialects.postgresql import TIMESTAMP
+from sqlalchemy import Index, String, func
+from sqlalchemy.dialects.postgresql import JSONB, TIMESTAMP
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base, intpk, str100
@@ -9,6 +9,10 @@ from app.models.base import Base, intpk, str100
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix__users_latitude_longitude", "latitude", "longitude"),
+        Index("ix__users_created_at_id", "created_at", "id"),
+    )
 
     id: Mapped[intpk]
     email: Mapped[str] = mapped_column(String(100), unique=True, index=True, nullable=False)
@@ -17,6 +21,7 @@ class User(Base):
     last_name: Mapped[str100] = mapped_column(nullable=False)
     gender: Mapped[str | None]
     avatar: Mapped[str | None]
+    avatar_variants: Mapped[dict | None] = mapped_column(JSONB)
     latitude: Mapped[float | None]
     longitude: Mapped[float | None]
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(), nullable=False, server_default=func.now())
@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 
+from .avatars import router as avatars_router
 from .clients import router as clients_router
 from .root import router as root_router
 
@@ -7,3 +8,5 @@ api_router = APIRouter()
 
 api_router.include_router(clients_router)
 api_router.include_router(root_router)
+
+__all__ = ["api_router", "avatars_router"]
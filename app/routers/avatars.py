@@ -0,0 +1,150 @@
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+
+import re
+import tempfile
+from pathlib import Path
+from typing import Literal
+
+from app.core.config import settings
+from app.core.executor import image_executor
+from app.services.storage import CACHE_CONTROL, get_avatar_storage
+from app.utils.cache import ByteLRU, DiskLRU, RenderCache
+from app.utils.watermark import AVATAR_FORMATS, AVATARS_PREFIX, resize_avatar
+
+AVATAR_NAME = re.compile(r"^(?P<digest>[0-9a-f]{32})\.(?P<extension>jpg|webp)$")
+EXTENSION_FORMATS = {"jpg": "jpeg", "webp": "webp"}
+
+router = APIRouter(tags=["Avatars"])
+
+render_cache = RenderCache(
+    memory=ByteLRU(max_bytes=settings.AVATAR_RENDER_CACHE_MEMORY),
+    disk=DiskLRU(
+        path=Path(settings.AVATAR_RENDER_CACHE_PATH or Path(tempfile.gettempdir()) / "avatar-renders"),
+        max_bytes=settings.AVATAR_RENDER_CACHE_DISK,
+    ),
+)
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail={"error": "Not Found", "error_description": "Avatar not found"},
+    )
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so `W/"<digest>"` matches the strong tag too."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag.removeprefix("W/") in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]
+
+
+def _parse_range(header: str) -> tuple[int | None, int | None] | None:
+    """Offsets of a single `bytes=` range as written, None for headers that are served in full instead.
+
+    Multiple ranges are not supported, and like other units or malformed headers they are ignored.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start, sep, end = spec.strip().partition("-")
+    if not sep or not (start or end):
+        return None
+    try:
+        first = int(start) if start else None
+        last = int(end) if end else None
+    except ValueError:
+        return None
+    if (first is not None and first < 0) or (last is not None and last < 0):
+        return None
+    if first is not None and last is not None and first > last:
+        return None
+    return first, last
+
+
+def _resolve_range(first: int | None, last: int | None, size: int) -> tuple[int, int] | None:
+    """Inclusive offsets of a parsed range within `size` bytes, None when it can't be satisfied."""
+    if first is None:
+        if not last:
+            return None
+        return max(size - last, 0), size - 1
+    if first >= size:
+        return None
+    return first, min(last, size - 1) if last is not None else size - 1
+
+
+@router.get("/static/avatars/{filename}", include_in_schema=False)
+async def avatar(
+    filename: str,
+    request: Request,
+    w: int | None = Query(None, ge=1, le=settings.AVATAR_RENDER_MAX_SIZE, description="Максимальная ширина"),
+    h: int | None = Query(None, ge=1, le=settings.AVATAR_RENDER_MAX_SIZE, description="Максимальная высота"),
+    fmt: Literal["jpeg", "webp"] | None = Query(None, description="Формат изображения"),
+) -> Response:
+    match = AVATAR_NAME.match(filename)
+    if not match:
+        raise _not_found()
+    storage = get_avatar_storage()
+    key = f"{AVATARS_PREFIX}/{filename}"
+
+    if w or h or fmt:
+        fmt = fmt or EXTENSION_FORMATS[match["extension"]]
+        etag = f'"{match["digest"]}-{w or 0}x{h or 0}-{fmt}"'
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if _not_modified(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        async def render() -> bytes:
+            if await storage.size(key) is None:
+                raise _not_found()
+            if image_executor.saturated:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail={"error": "Service Unavailable", "error_description": "Image processing is overloaded"},
+                    headers={"Retry-After": "1"},
+                )
+            master = b"".join([chunk async for chunk in storage.read(key)])
+            return await image_executor.run(resize_avatar, master, w, h, fmt)
+
+        data = await render_cache.get_or_render(f"{filename}:{w or 0}x{h or 0}:{fmt}", render)
+        return Response(content=data, media_type=AVATAR_FORMATS[fmt][2], headers=headers)
+
+    size = await storage.size(key)
+    if size is None:
+        raise _not_found()
+
+    etag = f'"{match["digest"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if _not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    media_type = AVATAR_FORMATS[EXTENSION_FORMATS[match["extension"]]][2]
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    requested = _parse_range(range_header) if range_header else None
+    if requested is None or (if_range and if_range.strip() != etag):
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(storage.read(key), media_type=media_type, headers=headers)
+
+    byte_range = _resolve_range(*requested, size)
+    if byte_range is None:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{size}"},
+        )
+    start, end = byte_range
+    headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+    return StreamingResponse(
+        storage.read(key, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -3,23 +3,24 @@ from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
 import os
-import uuid
 from typing import Annotated
 
 from dishka.integrations.fastapi import DishkaRoute, FromDishka
 from pydantic_core import ValidationError as PydanticValidationError
 
+from app.core.config import settings
 from app.core.db import DbConnection
 from app.daos.coincidences import CoincidenceDao
 from app.daos.user import UserDao
 from app.schemas.exceptions import HTTPError, ValidationError
 from app.schemas.token import Token
-from app.schemas.user import MatchUser, UserGender, UserIn
+from app.schemas.user import MatchBatchIn, MatchBatchOut, MatchResult, MatchStatus, MatchUser, UserGender, UserIn
 from app.services.auth import AuthService
-from app.services.emails import EmailService
-from app.services.redis import RedisService
+from app.services.jobs import JobQueue
+from app.services.like_graph import LikeGraph
+from app.services.rate_limit import RateLimiter
 from app.services.security import HTTPBearer
-from app.utils.watermark import add_watermark
+from app.utils.uploads import AVATAR_PLACEHOLDER, hand_off_avatar, spool_avatar
 
 router = APIRouter(route_class=DishkaRoute, tags=["Clients"], prefix="/clients")
 
@@ -34,12 +35,14 @@ router = APIRouter(route_class=DishkaRoute, tags=["Clients"], prefix="/clients")
         400: {"description": "Bad request", "model": HTTPError},
         401: {"description": "Unauthorized", "model": HTTPError},
         403: {"description": "Forbidden", "model": HTTPError},
+        503: {"description": "Service Unavailable", "model": HTTPError},
         201: {"description": "Created", "model": Token},
         200: {"description": "OK", "model": Token},
     },
 )
 async def create_client(
     auth_service: FromDishka[AuthService],
+    jobs: FromDishka[JobQueue],
     background_tasks: BackgroundTasks,
     email: Annotated[str, Form()],
     first_name: Annotated[str, Form()],
@@ -70,12 +73,6 @@ async def create_client(
                     "error_description": "Avatar must be an image with .jpeg or .jpg extension",
                 },
             )
-        if avatar.size > 10 * 1024 * 1024:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"error": "Bad Request", "error_description": "Avatar must be less than 10mb"},
-            )
-
         _, file_extension = os.path.splitext(avatar.filename)
 
         if file_extension != ".jpg" and file_extension != ".jpeg":
@@ -87,7 +84,14 @@ async def create_client(
                 },
             )
 
-        avatar_name = str(uuid.uuid4()) + file_extension
+        if await jobs.is_full():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={
+                    "error": "Service Unavailable",
+                    "error_description": "Avatar processing queue is full. Please try again later.",
+                },
+            )
 
     try:
         user_data = UserIn(
@@ -98,15 +102,25 @@ async def create_client(
             gender=gender,
             latitude=latitude,
             longitude=longitude,
-            avatar="photo_processing.jpg" if avatar else None,
+            avatar=AVATAR_PLACEHOLDER if avatar else None,
         )
     except PydanticValidationError as e:
         raise RequestValidationError(
             errors=e.errors(),
         )
-    tokens, exists = await auth_service.register_user(user_data)
-    if avatar and not exists:
-        background_tasks.add_task(add_watermark, avatar.file.read(), avatar_name, email)
+    avatar_path = await spool_avatar(avatar) if avatar else None
+    try:
+        tokens, new_user, exists = await auth_service.register_user(user_data)
+    except BaseException:
+        if avatar_path:
+            avatar_path.unlink(missing_ok=True)
+        raise
+    # Повторная регистрация с аватаркой повторяет её обработку, пока у участника осталась заглушка
+    if avatar_path and (not exists or new_user.avatar == AVATAR_PLACEHOLDER):
+        # Воркер может работать на другом хосте, поэтому файл передаётся через хранилище уже после ответа
+        background_tasks.add_task(hand_off_avatar, jobs, avatar_path, new_user.id)
+    elif avatar_path:
+        avatar_path.unlink(missing_ok=True)
     return JSONResponse(
         content=tokens.model_dump(), status_code=status.HTTP_201_CREATED if not exists else status.HTTP_200_OK
     )
@@ -130,8 +144,9 @@ async def match_client(
     id: int,
     db_connection: FromDishka[DbConnection],
     auth_service: FromDishka[AuthService],
-    redis: FromDishka[RedisService],
-    background_tasks: BackgroundTasks,
+    rate_limiter: FromDishka[RateLimiter],
+    jobs: FromDishka[JobQueue],
+    like_graph: FromDishka[LikeGraph],
     authorization: str = Depends(HTTPBearer()),
 ):
     """
@@ -151,35 +166,114 @@ async def match_client(
                 "error_description": "Can't match with yourself",
             },
         )
-    cache = await redis.get_cache(key=f"match_{user.id}", pickle_dump=False)
-    if cache:
-        if cache == 15:
+    # Проверка и списание лимита выполняются атомарно одним скриптом, день считается по часовому поясу участника
+    quota = await rate_limiter.daily(f"match:{user.id}", settings.MATCH_DAILY_LIMIT, longitude=user.longitude)
+    if not quota.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={
+                "error": "Too Many Requests",
+                "error_description": "Too many requests. Please try again later.",
+            },
+            headers=quota.headers,
+        )
+    if settings.LIKE_GRAPH_ENABLED:
+        # Симпатии хранятся в Redis и записываются в базу воркером, из базы читается только участник при совпадении
+        match_user = await UserDao(db_connection).get_by_id(id) if await like_graph.like(user.id, id) else None
+    else:
+        match_user = await CoincidenceDao(db_connection).create(dict(user_id=user.id, match_id=id))
+    if match_user:
+        await jobs.enqueue_many("email.send", _match_emails(user, match_user))
+        return JSONResponse(
+            content=MatchUser(email=match_user.email).model_dump(),
+            status_code=status.HTTP_200_OK,
+            headers=quota.headers,
+        )
+    return JSONResponse(content={}, status_code=status.HTTP_204_NO_CONTENT, headers=quota.headers)
+
+
+@router.post(
+    "/match/batch",
+    name="Пакетная оценка участников",
+    description="Оценивает до MATCH_BATCH_MAX участников за один запрос и возвращает результат по каждому из них. "
+    "Если дневной лимит исчерпывается, оцениваются первые участники списка, остальные получают статус rate_limited",
+    responses={
+        200: {"description": "OK", "model": MatchBatchOut},
+        401: {"description": "Unauthorized", "model": HTTPError},
+        403: {"description": "Forbidden", "model": HTTPError},
+        422: {"description": "Validation error", "model": ValidationError},
+        429: {"description": "Too Many Requests", "model": HTTPError},
+    },
+)
+async def match_clients_batch(
+    batch: MatchBatchIn,
+    db_connection: FromDishka[DbConnection],
+    auth_service: FromDishka[AuthService],
+    rate_limiter: FromDishka[RateLimiter],
+    jobs: FromDishka[JobQueue],
+    like_graph: FromDishka[LikeGraph],
+    authorization: str = Depends(HTTPBearer()),
+):
+    user = await auth_service.get_current_user(authorization.credentials)
+    requested = list(dict.fromkeys(batch.ids))
+    targets = [target_id for target_id in requested if target_id != user.id]
+
+    headers = None
+    liked, matched = set(), {}
+    if targets:
+        # Лимит списывается одним атомарным шагом, при нехватке разрешается только часть списка
+        quota = await rate_limiter.daily(
+            f"match:{user.id}", settings.MATCH_DAILY_LIMIT, longitude=user.longitude, cost=len(targets), partial=True
+        )
+        headers = quota.headers
+        if not quota.allowed:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail={
                     "error": "Too Many Requests",
                     "error_description": "Too many requests. Please try again later.",
                 },
+                headers=headers,
             )
+        granted = targets[: quota.granted]
+        liked = set(granted)
+        if settings.LIKE_GRAPH_ENABLED:
+            mutual_ids = await like_graph.like_many(user.id, granted)
+            match_users = await UserDao(db_connection).get_out_rows(mutual_ids) if mutual_ids else []
         else:
-            cache += 1
-            await redis.set_cache(key=f"match_{user.id}", value=cache, pickle_dump=False)
-    else:
-        await redis.set_cache(key=f"match_{user.id}", value=1, pickle_dump=False)
-    compared = await CoincidenceDao(db_connection).create(dict(user_id=user.id, match_id=id))
-    if compared:
-        match_user = await UserDao(db_connection).get_by_id(id)
-        background_tasks.add_task(
-            EmailService().send_email,
+            match_users = await CoincidenceDao(db_connection).create_batch(user.id, granted)
+        matched = {match_user.id: match_user for match_user in match_users}
+        if matched:
+            await jobs.enqueue_many(
+                "email.send", [email for match_user in matched.values() for email in _match_emails(user, match_user)]
+            )
+
+    results = []
+    for target_id in requested:
+        if target_id in matched:
+            results.append(MatchResult(id=target_id, status=MatchStatus.matched, email=matched[target_id].email))
+        elif target_id in liked:
+            results.append(MatchResult(id=target_id, status=MatchStatus.liked))
+        elif target_id == user.id:
+            results.append(MatchResult(id=target_id, status=MatchStatus.invalid))
+        else:
+            results.append(MatchResult(id=target_id, status=MatchStatus.rate_limited))
+    return JSONResponse(
+        content=MatchBatchOut(results=results).model_dump(mode="json"), status_code=status.HTTP_200_OK, headers=headers
+    )
+
+
+def _match_emails(user, match_user) -> list[dict[str, str]]:
+    """Arguments of the two email.send jobs notifying both users of a mutual match."""
+    return [
+        dict(
             email_to=match_user.email,
             subject="У вас есть совпадение",
             html_content=f"Вы понравились {user.first_name}! Почта участника: {user.email}",
-        )
-        background_tasks.add_task(
-            EmailService().send_email,
+        ),
+        dict(
             email_to=user.email,
             subject="У вас есть совпадение",
             html_content=f"Вы понравились {match_user.first_name}! Почта участника: {match_user.email}",
-        )
-        return JSONResponse(content=MatchUser(email=match_user.email).model_dump(), status_code=status.HTTP_200_OK)
-    return JSONResponse(content={}, status_code=status.HTTP_204_NO_CONTENT)
+        ),
+    ]
@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+
+import json
 
 from dishka.integrations.fastapi import DishkaRoute, FromDishka
-from sqlalchemy import asc, desc, func, select
 
+from app.core.config import settings
 from app.core.db import DbConnection
-from app.models.user import User
+from app.daos.user import UserDao
 from app.schemas.exceptions import HTTPError, ValidationError
-from app.schemas.user import UserGender, UserOut
+from app.schemas.user import UserGender, UserListFilter, UserOut, UserSortBy
 from app.schemas.utils import OrderBy, ResponseOffsetPagination
 from app.services.auth import AuthService
-from app.services.redis import RedisService
+from app.services.geo_index import geo_index
+from app.services.redis import USERS_GENERATION, RedisService
 from app.services.security import HTTPBearer
-
-R = 6371.0
+from app.utils.geo import cell_center, great_circle_km, km_to_degrees
+from app.utils.pagination import decode_cursor, encode_cursor
 
 router = APIRouter(route_class=DishkaRoute)
 
@@ -21,7 +24,8 @@ router = APIRouter(route_class=DishkaRoute)
     "/list",
     name="Получение списка участников",
     description="Доступна фильтрация по полу, имени и фамилии и сортировка по дате регистрации."
-    "Также доступен фильтр по дистанции относительно авторизованного участника.",
+    "Также доступен фильтр по дистанции относительно авторизованного участника "
+    "с сортировкой по расстоянию и полем distance_km в ответе.",
     responses={
         422: {"description": "Validation error", "model": ValidationError},
         400: {"description": "Bad request", "model": HTTPError},
@@ -30,6 +34,7 @@ router = APIRouter(route_class=DishkaRoute)
         200: {"description": "OK", "model": ResponseOffsetPagination[UserOut]},
     },
     status_code=status.HTTP_200_OK,
+    response_model=ResponseOffsetPagination[UserOut],
 )
 async def list(
     db_connection: FromDishka[DbConnection],
@@ -41,9 +46,13 @@ async def list(
     last_name: str | None = Query(None, description="Фильтр по фамилии"),
     radius_km: float | None = Query(None, ge=0.1, description="Фильтр в заданном радиусе относительно пользователя"),
     sort_by_registration_date: OrderBy | None = Query(None, description="Сортировка по дате регистрации"),
+    sort_by: UserSortBy | None = Query(None, description="Поле сортировки (distance только вместе с radius_km)"),
     limit: int = Query(10, ge=1),
     offset: int = Query(0, ge=0),
-) -> ResponseOffsetPagination[UserOut]:
+    cursor: str | None = Query(None, description="Курсор next_cursor предыдущей страницы вместо offset"),
+    include_total: bool = Query(True, description="Считать общее количество участников"),
+    approximate_total: bool = Query(False, description="Оценка общего количества по статистике планировщика"),
+) -> Response:
     """
     4.
     Минимум: Реализовать фильтрацию списка по полу, имени, фамилии.
@@ -62,61 +71,115 @@ async def list(
     """
     user = await auth_service.get_current_user(authorization.credentials)
 
-    cache_key = f"user_list:{user.id}:{gender}:{first_name}:{last_name}:{radius_km}:{sort_by_registration_date}:{limit}:{offset}"
-
-    # Проверяем, есть ли данные в кэше
-    cached_data = await redis.get_cache(cache_key)
-    if cached_data:
-        return cached_data
-
-    query = select(User)
-
-    if gender:
-        query = query.filter(User.gender == gender.value)
-    if first_name:
-        query = query.filter(User.first_name.ilike(f"%{first_name}%"))
-    if last_name:
-        query = query.filter(User.last_name.ilike(f"%{last_name}%"))
-
-    if sort_by_registration_date == "desc":
-        query = query.order_by(desc(User.created_at))
-    elif sort_by_registration_date == "asc":
-        query = query.order_by(asc(User.created_at))
-    elif sort_by_registration_date and sort_by_registration_date not in ["asc", "desc"]:
+    if sort_by == UserSortBy.distance and not radius_km:
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST,
-            detail={"error": "Bad Request", "error_description": "sort_by_registration_date must be 'asc' or 'desc'"},
+            detail={"error": "Bad Request", "error_description": "sort_by=distance requires radius_km"},
         )
-
+    filters = UserListFilter(
+        gender=gender,
+        first_name=first_name,
+        last_name=last_name,
+        radius_km=radius_km,
+        sort_by=sort_by,
+        order=sort_by_registration_date or (OrderBy.desc if sort_by == UserSortBy.created_at else OrderBy.asc),
+    )
+    sort_key = "distance" if filters.sort_by == UserSortBy.distance else "created_at"
+    after = decode_cursor(cursor, sort_key) if cursor else None
+    if after:
+        offset = 0
+
+    # Зритель влияет на выдачу только при фильтре по радиусу: тогда ключ содержит ячейку сетки,
+    # а радиус отсчитывается от её центра, чтобы соседи разделяли одну запись кэша.
+    # Размер ячейки пропорционален радиусу, поэтому смещение центра остаётся малой долей радиуса.
+    # Порядок «ближайшие первыми» от центра ячейки был бы неверен, такие страницы считаются от самого участника
+    latitude = longitude = None
+    viewer = "any"
+    shared_cell = False
     if radius_km:
-        user_lat = user.latitude
-        user_lon = user.longitude
-
-        # Вычисляем Haversine distance в запросе
-        distance = (
-            R
-            * 2
-            * func.asin(
-                func.sqrt(
-                    func.pow(func.sin((func.radians(User.latitude - user_lat)) / 2), 2)
-                    + func.cos(func.radians(user_lat))
-                    * func.cos(func.radians(User.latitude))
-                    * func.pow(func.sin((func.radians(User.longitude - user_lon)) / 2), 2)
-                )
+        viewer = "nowhere"
+        if user.latitude is not None and user.longitude is not None:
+            if filters.sort_by == UserSortBy.distance:
+                latitude, longitude = user.latitude, user.longitude
+            else:
+                cell_degrees = km_to_degrees(radius_km * settings.LIST_CACHE_CELL_FRACTION)
+                latitude, longitude = cell_center(user.latitude, user.longitude, cell_degrees)
+                shared_cell = True
+            viewer = f"{latitude},{longitude}"
+    generation = await redis.get_generation(USERS_GENERATION)
+
+    cache_key = (
+        f"list_page:{generation}:{viewer}:{filters.model_dump_json()}:{limit}:{offset}:{cursor}:"
+        f"{include_total}:{approximate_total}"
+    )
+
+    async def count_total(user_dao: UserDao) -> bytes:
+        count = await user_dao.count(filters, latitude, longitude, approximate=approximate_total)
+        return str(count).encode()
+
+    async def render_page() -> bytes:
+        if radius_km and geo_index is not None and geo_index.ready and latitude is not None and longitude is not None:
+            # Радиус, пол и имя считаются по индексу в памяти, из базы загружается только страница.
+            # Индекс загружается и обновляется в фоне, пока он не готов, запрос обслуживает SQL
+            matches = geo_index.search(
+                latitude,
+                longitude,
+                radius_km,
+                gender=gender.value if gender else None,
+                first_name=first_name,
+                last_name=last_name,
             )
-        )
-
-        query = query.filter(distance <= radius_km)
-        query = query.params(user_lat=user_lat, user_lon=user_lon)
-
-    query = query.limit(limit).offset(offset)
-
-    result = await db_connection.session.execute(query)
-    total = await db_connection.session.scalar(select(func.count()).select_from(query.subquery()))
-    users = result.scalars().all()
-
-    response = ResponseOffsetPagination(total=total, offset=offset, limit=limit, items=users)
+            total = len(matches["id"]) if include_total else None
+            ids, distances = geo_index.page(
+                matches, filters.sort_by, filters.order, limit=limit, offset=offset, after=after
+            )
+            rows_by_id = {row.id: row for row in await UserDao(db_connection).get_out_rows(ids)}
+            rows = [
+                {**rows_by_id[user_id]._asdict(), "distance_km": distance}
+                for user_id, distance in zip(ids, distances)
+                if user_id in rows_by_id
+            ]
+        else:
+            user_dao = UserDao(db_connection)
+            rows = [
+                row._asdict()
+                for row in await user_dao.search(filters, latitude, longitude, limit=limit, offset=offset, after=after)
+            ]
+            total = None
+            if include_total:
+                # Общее количество не зависит от страницы, поэтому кэшируется отдельно от неё
+                total_key = f"list_total:{generation}:{viewer}:{filters.model_dump_json(exclude={'sort_by', 'order'})}"
+                if approximate_total:
+                    total_key += ":approximate"
+                total = int(
+                    await redis.get_or_fill(
+                        total_key,
+                        lambda: count_total(user_dao),
+                        ttl=settings.LIST_TOTAL_TTL,
+                        soft_ttl=settings.LIST_TOTAL_SOFT_TTL,
+                    )
+                )
 
-    await redis.set_cache(cache_key, response)
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = encode_cursor(
+                sort_key, last["distance_km"] if sort_key == "distance" else last["created_at"], last["id"]
+            )
 
-    return response
+        response = ResponseOffsetPagination[UserOut](
+            total=total, offset=offset, limit=limit, items=rows, next_cursor=next_cursor
+        )
+        return response.model_dump_json().encode()
+
+    # В кэше хранится готовый JSON, при попадании он отдается без десериализации и валидации.
+    # Промах заполняет один запрос, остальные ждут его результат или получают устаревшую страницу
+    content = await redis.get_or_fill(cache_key, render_page, ttl=redis.ttl, soft_ttl=settings.LIST_SOFT_TTL)
+    if shared_cell:
+        # Страница общая для ячейки, а distance_km каждый участник должен видеть от своей точки
+        page = json.loads(content)
+        for item in page["items"]:
+            item["distance_km"] = great_circle_km(user.latitude, user.longitude, item["latitude"], item["longitude"])
+        content = json.dumps(page, ensure_ascii=False, separators=(",", ":")).encode()
+
+    return Response(content=content, media_type="application/json")
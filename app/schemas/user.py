@@ -1,7 +1,10 @@
 from enum import Enum
 from typing import Annotated
 
-from pydantic import BaseModel, ConfigDict, EmailStr, StringConstraints
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, StringConstraints
+
+from app.core.config import settings
+from app.schemas.utils import OrderBy
 
 
 class UserBase(BaseModel):
@@ -19,9 +22,28 @@ class UserIn(UserBase):
     avatar: str | None
 
 
+class UserSnapshot(UserBase):
+    """Authenticated principal as cached between requests."""
+
+    id: int
+
+
+class AvatarFormats(BaseModel):
+    jpeg: str
+    webp: str
+
+
+class AvatarVariants(BaseModel):
+    full: AvatarFormats
+    medium: AvatarFormats
+    thumbnail: AvatarFormats
+
+
 class UserOut(UserBase):
     id: int
     avatar: str | None
+    avatar_variants: AvatarVariants | None = None
+    distance_km: float | None = None
 
 
 class UserGender(str, Enum):
@@ -29,5 +51,40 @@ class UserGender(str, Enum):
     female = "женщина"
 
 
+class UserSortBy(str, Enum):
+    created_at = "created_at"
+    distance = "distance"
+
+
+class UserListFilter(BaseModel):
+    gender: UserGender | None = None
+    first_name: str | None = None
+    last_name: str | None = None
+    radius_km: float | None = None
+    sort_by: UserSortBy | None = None
+    order: OrderBy | None = None
+
+
 class MatchUser(BaseModel):
     email: EmailStr
+
+
+class MatchBatchIn(BaseModel):
+    ids: Annotated[list[int], Field(min_length=1, max_length=settings.MATCH_BATCH_MAX)]
+
+
+class MatchStatus(str, Enum):
+    matched = "matched"
+    liked = "liked"
+    rate_limited = "rate_limited"
+    invalid = "invalid"
+
+
+class MatchResult(BaseModel):
+    id: int
+    status: MatchStatus
+    email: EmailStr | None = None
+
+
+class MatchBatchOut(BaseModel):
+    results: list[MatchResult]
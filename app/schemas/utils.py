@@ -7,10 +7,11 @@ T = TypeVar("T")
 
 
 class ResponseOffsetPagination(BaseModel, Generic[T]):
-    total: int
+    total: int | None
     offset: int
     limit: int
     items: list[T]
+    next_cursor: str | None = None
 
 
 class OrderBy(str, Enum):
@@ -1,5 +1,8 @@
 from .auth import AuthService
 from .emails import EmailService
+from .jobs import JobQueue
+from .like_graph import LikeGraph
+from .rate_limit import RateLimiter
 from .redis import RedisService
 from .security import SecurityService
 
@@ -7,5 +10,8 @@ __all__ = [
     "AuthService",
     "SecurityService",
     "EmailService",
+    "JobQueue",
+    "LikeGraph",
+    "RateLimiter",
     "RedisService",
 ]
@@ -1,6 +1,7 @@
 from fastapi import HTTPException, status
 
 import logging
+import time
 from datetime import timedelta
 
 from jose import JWTError, jwt
@@ -10,37 +11,62 @@ from app.core.db import DbConnection
 from app.daos.user import UserDao
 from app.models.user import User as UserModel
 from app.schemas.token import Token, TokenData
-from app.schemas.user import UserIn
+from app.schemas.user import UserIn, UserSnapshot
 from app.services.emails import EmailService
+from app.services.redis import USERS_GENERATION, RedisService
 from app.services.security import SecurityService
+from app.utils.cache import ByteLRU
+
+# Decoded claims of recently seen tokens, each entry expires together with its token
+_decoded_tokens = ByteLRU(max_bytes=16 * 1024 * 1024, max_items=settings.TOKEN_MEMO_MAX_ITEMS)
 
 
 class AuthService:
-    def __init__(self, db_connection: DbConnection, security_service: SecurityService, email_service: EmailService):
+    def __init__(
+        self,
+        db_connection: DbConnection,
+        security_service: SecurityService,
+        email_service: EmailService,
+        redis_service: RedisService,
+    ):
         self.session = db_connection.session
         self.email_service = email_service
+        self.redis_service = redis_service
         self.security_service = security_service
         self.user_dao = UserDao(db_connection=db_connection)
 
-    async def register_user(self, user_data: UserIn) -> tuple[Token, bool]:
+    async def register_user(self, user_data: UserIn) -> tuple[Token, UserModel, bool]:
         user_exist = await self.user_email_exists(user_data.email)
 
         if user_exist:
-            token = await self.login(user_data.email, user_data.password)
-            return token, True
+            return await self._login_user(user_exist, user_data.password), user_exist, True
 
-        pass_for_login = user_data.password
+        # The password is hashed once and the token is issued from the inserted row without logging in again
+        password = user_data.password
+        user_data.password = await self.security_service.get_password_hash(password)
+        new_user = await self.user_dao.create_if_absent(user_data)
+        if new_user is None:
+            # Registered concurrently between the existence check and the insert
+            user_exist = await self.user_dao.get_by_email(user_data.email)
+            return await self._login_user(user_exist, password), user_exist, True
 
-        user_data.password = self.security_service.get_password_hash(user_data.password)
-        new_user = await self.user_dao.create(user_data)
+        await self.redis_service.bump_generation(USERS_GENERATION)
         logging.info(f"New user created successfully: {new_user}!!!")
-        token = await self.login(new_user.email, pass_for_login)
-        return token, False
+        return self._issue_token(new_user), new_user, False
 
     async def authenticate_user(self, email: str, password: str) -> UserModel | bool:
         _user = await self.user_dao.get_by_email(email)
-        if not _user or not self.security_service.verify_password(password, _user.password):
+        if not _user:
+            return False
+        return await self._verify_user(_user, password)
+
+    async def _verify_user(self, _user: UserModel, password: str) -> UserModel | bool:
+        if not await self.security_service.verify_password(password, _user.password):
             return False
+        if self.security_service.needs_rehash(_user.password):
+            # BCRYPT_ROUNDS changed since the hash was made, the plain password is only known right now
+            password_hash = await self.security_service.get_password_hash(password)
+            await self.user_dao.update_password(_user.id, password_hash)
         return _user
 
     async def user_email_exists(self, email: str) -> UserModel | None:
@@ -50,14 +76,25 @@ class AuthService:
     async def login(self, email: str, password: str) -> Token:
         _user = await self.authenticate_user(email, password)
         if not _user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"error": "Bad Request", "error_description": "Incorrect email or password"},
-            )
+            raise self._login_failed()
+        return self._issue_token(_user)
+
+    async def _login_user(self, _user: UserModel, password: str) -> Token:
+        if not await self._verify_user(_user, password):
+            raise self._login_failed()
+        return self._issue_token(_user)
 
+    @staticmethod
+    def _login_failed() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"error": "Bad Request", "error_description": "Incorrect email or password"},
+        )
+
+    def _issue_token(self, _user: UserModel) -> Token:
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = self.security_service.create_access_token(
-            data={"sub": _user.email}, expires_delta=access_token_expires
+            data={"sub": _user.email, "uid": _user.id}, expires_delta=access_token_expires
         )
         token_data = {
             "access_token": access_token,
@@ -65,21 +102,42 @@ class AuthService:
         }
         return Token(**token_data)
 
-    async def get_current_user(self, token: str) -> UserModel:
+    async def get_current_user(self, token: str) -> UserSnapshot:
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error": "Unauthorized", "error_description": "Could not validate credentials"},
             headers={"WWW-Authenticate": "Bearer"},
         )
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[self.security_service.ALGORITHM])
-            email: str = payload.get("sub")
-            if not email:
+        memo = _decoded_tokens.get(token)
+        if memo is not None:
+            token_data = TokenData.model_validate_json(memo)
+        else:
+            try:
+                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[self.security_service.ALGORITHM])
+                email: str = payload.get("sub")
+                if not email:
+                    raise credentials_exception
+                token_data = TokenData(email=email, user_id=payload.get("uid"))
+            except JWTError:
                 raise credentials_exception
-            token_data = TokenData(email=email)
-        except JWTError:
-            raise credentials_exception
-        _user = await self.user_dao.get_by_email(email=token_data.email)
+            # The signature is checked once, afterwards the token is trusted until it expires
+            _decoded_tokens.set(token, token_data.model_dump_json().encode(), ttl=payload["exp"] - time.time())
+
+        if token_data.user_id is not None:
+            cached = await self.redis_service.get_cache(f"principal:{token_data.user_id}", pickle_dump=False)
+            if cached:
+                return UserSnapshot.model_validate_json(cached)
+            _user = await self.user_dao.get_by_id(token_data.user_id)
+        else:
+            # Tokens issued before the uid claim only carry the email
+            _user = await self.user_dao.get_by_email(email=token_data.email)
         if not _user:
             raise credentials_exception
-        return _user
+        snapshot = UserSnapshot.model_validate(_user)
+        await self.redis_service.set_cache(
+            f"principal:{snapshot.id}",
+            snapshot.model_dump_json().encode(),
+            pickle_dump=False,
+            ttl=settings.PRINCIPAL_CACHE_TTL,
+        )
+        return snapshot
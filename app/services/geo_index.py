@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import math
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import AsyncSessionFactory, DbConnection
+from app.models.user import User
+from app.utils.geo import EARTH_RADIUS_KM, bounding_box
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+
+class GeoIndex:
+    """In-process, array-backed snapshot of users for radius queries.
+
+    Points are kept as unit-sphere vectors sorted by a (latitude cell, longitude) key, so every
+    latitude cell of a bounding box maps to one contiguous slice per longitude range. Users
+    registered since the last rebuild live in a small unsorted tail that is scanned linearly.
+    It is loaded and refreshed in the background, `ready` turns true after the first complete load.
+    """
+
+    def __init__(self, cell_degrees: float, refresh_interval: float, max_tail: int) -> None:
+        if np is None:
+            raise RuntimeError("The in-memory geo index requires the numpy package")
+        self.cell_degrees = cell_degrees
+        self.refresh_interval = refresh_interval
+        self.max_tail = max_tail
+        self._max_id = 0
+        self.ready = False
+        self._lock = asyncio.Lock()
+        self._sorted = self._empty()
+        self._tail = self._empty()
+
+    @staticmethod
+    def _empty() -> dict:
+        return {
+            "id": np.empty(0, dtype=np.int64),
+            "key": np.empty(0, dtype=np.float64),
+            "xyz": np.empty((0, 3), dtype=np.float64),
+            "created_at": np.empty(0, dtype="datetime64[us]"),
+            "gender": np.empty(0, dtype=object),
+            "first_name": np.empty(0, dtype=object),
+            "last_name": np.empty(0, dtype=object),
+        }
+
+    def __len__(self) -> int:
+        return len(self._sorted["id"]) + len(self._tail["id"])
+
+    def _key(self, latitude, longitude):
+        # longitude is shifted to [0, 360] so it never overflows into the next latitude cell
+        return np.floor((latitude + 90) / self.cell_degrees) * 1000 + (longitude + 180)
+
+    @staticmethod
+    def _unit_vectors(latitude, longitude):
+        lat, lon = np.radians(latitude), np.radians(longitude)
+        return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+    async def refresh(self, session: AsyncSession) -> None:
+        """Pull users registered since the previous refresh."""
+        async with self._lock:
+            statement = (
+                select(
+                    User.id,
+                    User.latitude,
+                    User.longitude,
+                    User.created_at,
+                    User.gender,
+                    User.first_name,
+                    User.last_name,
+                )
+                .where(User.id > self._max_id, User.latitude.is_not(None), User.longitude.is_not(None))
+                .order_by(User.id)
+            )
+            rows = (await session.execute(statement)).all()
+            if rows:
+                self._append(rows)
+            self.ready = True
+
+    def _append(self, rows) -> None:
+        ids, latitudes, longitudes, created_at, genders, first_names, last_names = zip(*rows)
+        latitude = np.fromiter(latitudes, dtype=np.float64, count=len(rows))
+        longitude = np.fromiter(longitudes, dtype=np.float64, count=len(rows))
+        chunk = {
+            "id": np.fromiter(ids, dtype=np.int64, count=len(rows)),
+            "key": self._key(latitude, longitude),
+            "xyz": self._unit_vectors(latitude, longitude),
+            "created_at": np.array(created_at, dtype="datetime64[us]"),
+            "gender": np.array(genders, dtype=object),
+            "first_name": np.array([name.lower() for name in first_names], dtype=object),
+            "last_name": np.array([name.lower() for name in last_names], dtype=object),
+        }
+        self._tail = {name: np.concatenate((self._tail[name], chunk[name])) for name in chunk}
+        self._max_id = int(chunk["id"][-1])
+        if len(self._tail["id"]) > self.max_tail:
+            merged = {name: np.concatenate((self._sorted[name], self._tail[name])) for name in chunk}
+            order = np.argsort(merged["key"], kind="stable")
+            self._sorted = {name: values[order] for name, values in merged.items()}
+            self._tail = self._empty()
+
+    def _candidates(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        """Positions in the sorted arrays that fall into the bounding box of the circle."""
+        min_lat, max_lat, longitude_ranges = bounding_box(latitude, longitude, radius_km)
+        first_cell = math.floor((min_lat + 90) / self.cell_degrees)
+        last_cell = math.floor((max_lat + 90) / self.cell_degrees)
+        keys = self._sorted["key"]
+        slices = []
+        for cell in range(first_cell, last_cell + 1):
+            for low, high in longitude_ranges:
+                start = np.searchsorted(keys, cell * 1000 + low + 180, side="left")
+                end = np.searchsorted(keys, cell * 1000 + high + 180, side="right")
+                if start < end:
+                    slices.append(np.arange(start, end))
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def search(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        gender: str | None = None,
+        first_name: str | None = None,
+        last_name: str | None = None,
+    ) -> dict:
+        """Arrays of `id`, `distance_km` and `created_at` for every user matching the filters."""
+        columns = ("id", "xyz", "created_at", "gender", "first_name", "last_name")
+        candidates = self._candidates(latitude, longitude, radius_km)
+        pool = {name: np.concatenate((self._sorted[name][candidates], self._tail[name])) for name in columns}
+
+        origin = self._unit_vectors(np.array([latitude]), np.array([longitude]))[0]
+        chord = np.linalg.norm(pool["xyz"] - origin, axis=1)
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+        mask = distance <= radius_km
+        if gender:
+            mask &= pool["gender"] == gender
+        for name, needle in (("first_name", first_name), ("last_name", last_name)):
+            if needle:
+                needle = needle.lower()
+                mask &= np.fromiter((needle in value for value in pool[name]), dtype=bool, count=len(mask))
+        return {"id": pool["id"][mask], "distance_km": distance[mask], "created_at": pool["created_at"][mask]}
+
+    def page(
+        self,
+        matches: dict,
+        sort_by: str | None,
+        order: str | None,
+        limit: int,
+        offset: int,
+        after: tuple[datetime | float, int] | None = None,
+    ) -> tuple[list[int], list[float]]:
+        """Ids and distances of one page of `matches`, optionally starting right after the `after` keyset."""
+        ids = matches["id"]
+        keys = matches["distance_km"] if sort_by == "distance" else matches["created_at"]
+        descending = sort_by != "distance" and order == "desc"
+        if after is not None:
+            value, last_id = after
+            if sort_by != "distance":
+                value = np.datetime64(value, "us")
+            if descending:
+                mask = (keys < value) | ((keys == value) & (ids < last_id))
+            else:
+                mask = (keys > value) | ((keys == value) & (ids > last_id))
+            matches = {name: values[mask] for name, values in matches.items()}
+            ids, keys = ids[mask], keys[mask]
+
+        if sort_by == "distance":
+            # Only the first offset + limit entries are ordered, the rest is split off by argpartition
+            count = min(offset + limit, len(ids))
+            if 0 < count < len(ids):
+                positions = np.argpartition(keys, count - 1)[:count]
+            else:
+                positions = np.arange(len(ids))
+            positions = positions[np.lexsort((ids[positions], keys[positions]))]
+        elif descending:
+            positions = np.lexsort((-ids, -keys.astype(np.int64)))
+        else:
+            positions = np.lexsort((ids, keys))
+        positions = positions[offset : offset + limit]
+        return ids[positions].tolist(), matches["distance_km"][positions].tolist()
+
+
+geo_index = (
+    GeoIndex(
+        cell_degrees=settings.GEO_INDEX_CELL_DEGREES,
+        refresh_interval=settings.GEO_INDEX_REFRESH_SECONDS,
+        max_tail=settings.GEO_INDEX_MAX_TAIL,
+    )
+    if settings.GEO_INDEX_ENABLED
+    else None
+)
+
+
+async def refresh_geo_index() -> None:
+    connection = DbConnection(session=AsyncSessionFactory())
+    try:
+        await geo_index.refresh(connection.session)
+    except Exception:
+        logging.exception("Failed to refresh the geo index")
+    finally:
+        await connection.close()
+
+
+async def keep_geo_index_fresh() -> None:
+    """Pick up new registrations every `refresh_interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(geo_index.refresh_interval)
+        await refresh_geo_index()
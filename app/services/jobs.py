@@ -0,0 +1,135 @@
+import json
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+
+# Moves due retries and jobs with an expired visibility timeout back to the pending list,
+# then pops the next job, makes it invisible until ARGV[2] and counts the delivery.
+# A job whose worker died never fails with an error, the delivery count is what still bounds its runs.
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+for _, source in ipairs({KEYS[3], KEYS[2]}) do
+    local ids = redis.call('ZRANGEBYSCORE', source, '-inf', now, 'LIMIT', 0, 100)
+    for _, id in ipairs(ids) do
+        redis.call('ZREM', source, id)
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+local id = redis.call('RPOP', KEYS[1])
+if not id then
+    return nil
+end
+redis.call('ZADD', KEYS[2], ARGV[2], id)
+local deliveries = redis.call('HINCRBY', KEYS[5], id, 1)
+return {id, redis.call('HGET', KEYS[4], id), deliveries}
+"""
+
+
+@dataclass
+class Job:
+    task: str
+    kwargs: dict
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    attempts: int = 0
+    deliveries: int = 0
+    error: str | None = None
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self))
+
+
+class JobQueue:
+    """Durable Redis queue with visibility timeouts, delayed retries and a dead-letter list."""
+
+    def __init__(self, redis: Redis) -> None:
+        self._redis = redis
+        self.name = settings.JOB_QUEUE_NAME
+        self.pending_key = f"{self.name}:pending"
+        self.processing_key = f"{self.name}:processing"
+        self.delayed_key = f"{self.name}:delayed"
+        self.jobs_key = f"{self.name}:jobs"
+        self.dead_key = f"{self.name}:dead"
+        self.deliveries_key = f"{self.name}:deliveries"
+        self._reserve = redis.register_script(RESERVE_SCRIPT)
+
+    async def is_full(self) -> bool:
+        return await self._redis.llen(self.pending_key) >= settings.JOB_QUEUE_MAX_LENGTH
+
+    async def enqueue(self, task: str, **kwargs) -> Job:
+        job = Job(task=task, kwargs=kwargs)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.jobs_key, job.id, job.dumps())
+            pipe.lpush(self.pending_key, job.id)
+            await pipe.execute()
+        return job
+
+    async def enqueue_many(self, task: str, kwargs_list: list[dict]) -> list[Job]:
+        jobs = [Job(task=task, kwargs=kwargs) for kwargs in kwargs_list]
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for job in jobs:
+                pipe.hset(self.jobs_key, job.id, job.dumps())
+                pipe.lpush(self.pending_key, job.id)
+            await pipe.execute()
+        return jobs
+
+    async def reserve(self) -> Job | None:
+        now = time.time()
+        result = await self._reserve(
+            keys=[self.pending_key, self.processing_key, self.delayed_key, self.jobs_key, self.deliveries_key],
+            args=[now, now + settings.JOB_VISIBILITY_TIMEOUT],
+        )
+        if not result:
+            return None
+        job_id, payload, deliveries = result
+        if payload is None:
+            # the job body was removed while its id was still queued
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.zrem(self.processing_key, job_id)
+                pipe.hdel(self.deliveries_key, job_id)
+                await pipe.execute()
+            return None
+        job = Job(**json.loads(payload))
+        job.deliveries = deliveries
+        return job
+
+    def exhausted(self, job: Job) -> bool:
+        """Whether the job was delivered more often than it may run, because workers died while running it."""
+        return job.deliveries > settings.JOB_MAX_ATTEMPTS
+
+    async def touch(self, job: Job) -> None:
+        await self._redis.zadd(self.processing_key, {job.id: time.time() + settings.JOB_VISIBILITY_TIMEOUT}, xx=True)
+
+    async def ack(self, job: Job) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.processing_key, job.id)
+            pipe.hdel(self.jobs_key, job.id)
+            pipe.hdel(self.deliveries_key, job.id)
+            await pipe.execute()
+
+    async def retry(self, job: Job, error: str) -> bool:
+        """Schedule the job again with backoff, returns False when it ran out of attempts and was buried."""
+        job.attempts += 1
+        job.error = error
+        if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            await self.bury(job, error)
+            return False
+        delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.processing_key, job.id)
+            pipe.hset(self.jobs_key, job.id, job.dumps())
+            pipe.zadd(self.delayed_key, {job.id: time.time() + delay})
+            await pipe.execute()
+        return True
+
+    async def bury(self, job: Job, error: str) -> None:
+        job.error = error
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.processing_key, job.id)
+            pipe.hdel(self.jobs_key, job.id)
+            pipe.hdel(self.deliveries_key, job.id)
+            pipe.lpush(self.dead_key, job.dumps())
+            await pipe.execute()
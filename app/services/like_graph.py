@@ -0,0 +1,129 @@
+import logging
+import uuid
+
+from redis.asyncio import Redis
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.db import DbConnection
+from app.daos.coincidences import CoincidenceDao
+from app.models.coincidences import Coincidence
+from app.services.redis import RELEASE_LOCK_SCRIPT
+
+# Records each new like once, queues it for Postgres and returns the liked users that made the pair mutual.
+# KEYS: outgoing likes of the user, pending list, outgoing likes of each liked user; ARGV: user id, liked user ids
+LIKE_SCRIPT = """
+local mutual = {}
+for i = 2, #ARGV do
+    if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+        local is_mutual = redis.call('SISMEMBER', KEYS[i + 1], ARGV[1])
+        redis.call('RPUSH', KEYS[2], ARGV[1] .. ':' .. ARGV[i] .. ':' .. is_mutual)
+        if is_mutual == 1 then
+            table.insert(mutual, tonumber(ARGV[i]))
+        end
+    end
+end
+return mutual
+"""
+
+# Trims the stored batch off the pending list only while the flush lock is still held by this flusher, once it
+# expired another flusher may have stored and trimmed the same entries already.
+# KEYS: flush lock, pending list; ARGV: lock token, number of stored entries
+TRIM_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('LTRIM', KEYS[2], ARGV[2], -1)
+return 1
+"""
+
+
+class LikeGraph:
+    """Likes kept in Redis sets of outgoing likes per user and written behind to the coincidences table."""
+
+    prefix = "likes"
+
+    def __init__(self, redis: Redis) -> None:
+        self._redis = redis
+        self._like = redis.register_script(LIKE_SCRIPT)
+        self._release_lock = redis.register_script(RELEASE_LOCK_SCRIPT)
+        self._trim = redis.register_script(TRIM_SCRIPT)
+        self.pending_key = f"{self.prefix}:pending"
+        self.lock_key = f"{self.prefix}:flush:lock"
+
+    def _out_key(self, user_id: int) -> str:
+        return f"{self.prefix}:out:{user_id}"
+
+    async def like(self, user_id: int, match_id: int) -> bool:
+        """Whether this like of user_id for match_id made the pair mutual, repeated likes never do."""
+        return match_id in await self.like_many(user_id, [match_id])
+
+    async def like_many(self, user_id: int, match_ids: list[int]) -> list[int]:
+        """Like all of match_ids in one script call, returns those that became mutual matches."""
+        return await self._like(
+            keys=[self._out_key(user_id), self.pending_key, *map(self._out_key, match_ids)],
+            args=[user_id, *match_ids],
+        )
+
+    async def flush(self, db_connection: DbConnection) -> int:
+        """Store the next batch of pending likes, returns how many were written.
+
+        Entries are only trimmed from the pending list after the commit, and storing them is idempotent,
+        so a crash in between writes the batch twice instead of losing it. A flush that outlived its lock
+        leaves the trim to the next one rather than dropping entries it never stored.
+        """
+        token = uuid.uuid4().hex
+        acquired = await self._redis.set(
+            self.lock_key, token, nx=True, px=int(settings.LIKE_GRAPH_FLUSH_LOCK_TIMEOUT * 1000)
+        )
+        if not acquired:
+            return 0
+        try:
+            entries = await self._redis.lrange(self.pending_key, 0, settings.LIKE_GRAPH_FLUSH_BATCH_SIZE - 1)
+            if not entries:
+                return 0
+            likes, matches = [], []
+            for entry in entries:
+                user_id, match_id, mutual = map(int, entry.split(b":"))
+                likes.append((user_id, match_id))
+                if mutual:
+                    matches.append((match_id, user_id))
+            await CoincidenceDao(db_connection).create_many(likes, matches)
+            if not await self._trim(keys=[self.lock_key, self.pending_key], args=[token, len(entries)]):
+                logging.warning(f"Like flush lock expired while storing {len(entries)} likes, leaving them queued")
+            return len(entries)
+        finally:
+            await self._release_lock(keys=[self.lock_key], args=[token])
+
+    async def rebuild(self, db_connection: DbConnection) -> int:
+        """Replace the sets in Redis with the likes stored in Postgres, returns the number of likes loaded."""
+        while await self.flush(db_connection):
+            pass
+        async for keys in self._scan_batches(f"{self.prefix}:out:*"):
+            await self._redis.unlink(*keys)
+
+        loaded = 0
+        result = await db_connection.session.stream(
+            select(Coincidence.first_user_id, Coincidence.second_user_id, Coincidence.compared)
+        )
+        async for rows in result.partitions(settings.LIKE_GRAPH_FLUSH_BATCH_SIZE):
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for first_user_id, second_user_id, compared in rows:
+                    pipe.sadd(self._out_key(first_user_id), second_user_id)
+                    if compared:
+                        # A compared row means its second user liked back, older rows did not store that like
+                        pipe.sadd(self._out_key(second_user_id), first_user_id)
+                await pipe.execute()
+            loaded += len(rows)
+        logging.info(f"Loaded {loaded} likes into the like graph")
+        return loaded
+
+    async def _scan_batches(self, pattern: str):
+        batch = []
+        async for key in self._redis.scan_iter(match=pattern, count=1000):
+            batch.append(key)
+            if len(batch) == 1000:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -0,0 +1,161 @@
+import math
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+from redis.asyncio import Redis
+
+# Every script grants `cost` units or, with ARGV partial = 1, as many as are left, in a single round trip.
+
+# KEYS[1] counter of the current window; ARGV: limit, cost, window ms, partial
+FIXED_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = math.min(cost, math.max(limit - used, 0))
+if granted < cost and ARGV[4] ~= '1' then
+    granted = 0
+end
+if granted > 0 then
+    used = redis.call('INCRBY', KEYS[1], granted)
+end
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl == -1 then
+    redis.call('PEXPIRE', KEYS[1], window)
+end
+if ttl < 0 then
+    ttl = window
+end
+return {granted, used, ttl}
+"""
+
+# KEYS[1] counter of the current window, KEYS[2] of the previous one, weighted by how much of it still overlaps;
+# ARGV: limit, cost, window ms, elapsed ms of the current window, partial
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local elapsed = tonumber(ARGV[4])
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local used = math.floor(previous * (window - elapsed) / window) + current
+local granted = math.min(cost, math.max(limit - used, 0))
+if granted < cost and ARGV[5] ~= '1' then
+    granted = 0
+end
+if granted > 0 then
+    redis.call('INCRBY', KEYS[1], granted)
+    redis.call('PEXPIRE', KEYS[1], window * 2)
+end
+return {granted, used + granted, window - elapsed}
+"""
+
+# KEYS[1] hash with the tokens left and the time of the last refill; ARGV: capacity, tokens per ms, now ms, cost, partial
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+local granted = math.min(cost, math.floor(tokens))
+if granted < cost and ARGV[5] ~= '1' then
+    granted = 0
+end
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1000)
+local wait = 0
+if tokens < 1 then
+    wait = math.ceil((1 - tokens) / rate)
+end
+return {granted, capacity - math.floor(tokens), wait}
+"""
+
+
+@dataclass
+class RateLimit:
+    """Outcome of one check: `granted` of the `requested` units, `reset_after` seconds until more are available."""
+
+    limit: int
+    used: int
+    requested: int
+    granted: int
+    reset_after: float
+
+    @property
+    def allowed(self) -> bool:
+        return self.granted > 0
+
+    @property
+    def remaining(self) -> int:
+        return max(self.limit - self.used, 0)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if self.granted < self.requested:
+            headers["Retry-After"] = str(math.ceil(self.reset_after))
+        return headers
+
+
+def local_day(longitude: float | None, now: datetime | None = None) -> tuple[str, float]:
+    """Calendar day at the given longitude and the seconds left until its midnight.
+
+    Users only have coordinates, so the timezone is approximated by the solar offset of one hour per 15°.
+    """
+    now = now or datetime.now(UTC)
+    local = now + timedelta(hours=round((longitude or 0.0) / 15))
+    midnight = datetime.combine(local.date() + timedelta(days=1), datetime.min.time(), tzinfo=UTC)
+    return local.date().isoformat(), (midnight - local).total_seconds()
+
+
+class RateLimiter:
+    def __init__(self, redis: Redis) -> None:
+        self._fixed_window = redis.register_script(FIXED_WINDOW_SCRIPT)
+        self._sliding_window = redis.register_script(SLIDING_WINDOW_SCRIPT)
+        self._token_bucket = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def fixed_window(
+        self, key: str, limit: int, window: float, cost: int = 1, partial: bool = False
+    ) -> RateLimit:
+        """Counter for `key` that starts with the first request and expires `window` seconds later."""
+        granted, used, ttl = await self._fixed_window(
+            keys=[f"ratelimit:{key}"], args=[limit, cost, math.ceil(window * 1000), int(partial)]
+        )
+        return RateLimit(limit=limit, used=used, requested=cost, granted=granted, reset_after=ttl / 1000)
+
+    async def sliding_window(
+        self, key: str, limit: int, window: float, cost: int = 1, partial: bool = False
+    ) -> RateLimit:
+        window_ms = math.ceil(window * 1000)
+        index, elapsed = divmod(int(time.time() * 1000), window_ms)
+        granted, used, reset_after = await self._sliding_window(
+            keys=[f"ratelimit:{key}:{index}", f"ratelimit:{key}:{index - 1}"],
+            args=[limit, cost, window_ms, elapsed, int(partial)],
+        )
+        return RateLimit(limit=limit, used=used, requested=cost, granted=granted, reset_after=reset_after / 1000)
+
+    async def token_bucket(
+        self, key: str, capacity: int, refill_rate: float, cost: int = 1, partial: bool = False
+    ) -> RateLimit:
+        """Bucket of `capacity` tokens refilled by `refill_rate` tokens per second."""
+        granted, used, wait = await self._token_bucket(
+            keys=[f"ratelimit:{key}"],
+            args=[capacity, refill_rate / 1000, int(time.time() * 1000), cost, int(partial)],
+        )
+        return RateLimit(limit=capacity, used=used, requested=cost, granted=granted, reset_after=wait / 1000)
+
+    async def daily(
+        self, key: str, limit: int, longitude: float | None, cost: int = 1, partial: bool = False
+    ) -> RateLimit:
+        """Quota that resets at midnight of the user's local day instead of a day after the first request."""
+        day, until_midnight = local_day(longitude)
+        return await self.fixed_window(f"{key}:{day}", limit, until_midnight, cost=cost, partial=partial)
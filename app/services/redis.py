@@ -1,25 +1,82 @@
+import asyncio
+import logging
 import pickle
+import struct
+import time
+import uuid
+from collections.abc import Awaitable, Callable
 
 from redis.asyncio import Redis
 
 from app.core.config import settings
+from app.utils.cache import ByteLRU, SingleFlight
+
+# Bumped whenever listed users change, cached /list pages and totals embed it in their keys
+USERS_GENERATION = "users"
+
+# Messages are "<instance>:<key>", the instance id lets a process skip its own invalidations
+INSTANCE_ID = uuid.uuid4().hex
+
+local_cache = (
+    ByteLRU(max_bytes=settings.LOCAL_CACHE_MAX_BYTES, max_items=settings.LOCAL_CACHE_MAX_ITEMS)
+    if settings.LOCAL_CACHE_ENABLED
+    else None
+)
+
+
+# Deletes a fill lock only while it still holds the token of its owner
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Entries written by get_or_fill start with the wall-clock time until which they are fresh
+FRESH_UNTIL = struct.Struct(">d")
+
+_fills = SingleFlight[bytes]()
+
+
+def _encoded(value: object) -> bytes:
+    """The bytes Redis returns for a stored value."""
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
 
 
 class RedisService:
     def __init__(self, redis: Redis) -> None:
         self._redis = redis
         self.ttl = settings.REDIS_TTL
+        self._release_lock = redis.register_script(RELEASE_LOCK_SCRIPT)
 
     async def ping(self):
         return await self._redis.ping()
 
-    async def set_cache(self, key: str, value: object, pickle_dump: bool = True):
+    async def _publish_invalidation(self, key: str, command: str, *args) -> object:
+        """Run a write command together with the invalidation message in one round trip."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            getattr(pipe, command)(key, *args)
+            pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, f"{INSTANCE_ID}:{key}")
+            result, _ = await pipe.execute()
+        return result
+
+    async def set_cache(self, key: str, value: object, pickle_dump: bool = True, ttl: int | None = None):
         if pickle_dump:
             value = pickle.dumps(value)
-        return await self._redis.set(key, value, ex=self.ttl)
+        ttl = ttl or self.ttl
+        if local_cache is None:
+            return await self._redis.set(key, value, ex=ttl)
+        local_cache.set(key, _encoded(value), ttl=min(ttl, settings.LOCAL_CACHE_TTL))
+        return await self._publish_invalidation(key, "set", value, ttl)
 
     async def get_cache(self, key: str, pickle_dump: bool = True) -> object:
-        value = await self._redis.get(key)
+        value = local_cache.get(key) if local_cache is not None else None
+        if value is None:
+            value = await self._redis.get(key)
+            if value and local_cache is not None:
+                local_cache.set(key, value, ttl=settings.LOCAL_CACHE_TTL)
         if not value:
             return None
         if pickle_dump:
@@ -27,4 +84,88 @@ class RedisService:
         return value
 
     async def delete_cache(self, key: str):
-        return await self._redis.delete(key)
+        if local_cache is None:
+            return await self._redis.delete(key)
+        local_cache.pop(key)
+        return await self._publish_invalidation(key, "delete")
+
+    async def get_generation(self, name: str) -> int:
+        value = await self.get_cache(f"generation:{name}", pickle_dump=False)
+        return int(value) if value else 0
+
+    async def bump_generation(self, name: str) -> int:
+        """Make every key built with the previous generation unreachable, they expire on their own TTL."""
+        key = f"generation:{name}"
+        if local_cache is None:
+            return await self._redis.incr(key)
+        local_cache.pop(key)
+        return await self._publish_invalidation(key, "incr")
+
+    async def get_or_fill(self, key: str, fill: Callable[[], Awaitable[bytes]], ttl: int, soft_ttl: int) -> bytes:
+        """Cached bytes of `key`, computed by `fill` at most once at a time across requests and processes.
+
+        After `soft_ttl` the stale value is still served while the one request holding the fill lock
+        recomputes it, callers only wait for `fill` when the entry is missing or past its hard `ttl`.
+        """
+        cached = await self.get_cache(key, pickle_dump=False)
+        if cached:
+            (fresh_until,) = FRESH_UNTIL.unpack_from(cached)
+            value = cached[FRESH_UNTIL.size :]
+            if time.time() < fresh_until:
+                return value
+            token = await self._acquire_fill_lock(key)
+            if token is None:
+                return value
+            try:
+                return await self._store_filled(key, await fill(), ttl, soft_ttl)
+            finally:
+                await self._release_lock(keys=[f"lock:{key}"], args=[token])
+        return await _fills.run(key, lambda: self._fill(key, fill, ttl, soft_ttl))
+
+    async def _fill(self, key: str, fill: Callable[[], Awaitable[bytes]], ttl: int, soft_ttl: int) -> bytes:
+        deadline = time.monotonic() + settings.CACHE_FILL_LOCK_TIMEOUT
+        while True:
+            token = await self._acquire_fill_lock(key)
+            if token is not None:
+                try:
+                    return await self._store_filled(key, await fill(), ttl, soft_ttl)
+                finally:
+                    await self._release_lock(keys=[f"lock:{key}"], args=[token])
+            # Another process is filling the key, wait for its value instead of repeating the work
+            await asyncio.sleep(settings.CACHE_FILL_WAIT_INTERVAL)
+            cached = await self._redis.get(key)
+            if cached:
+                return cached[FRESH_UNTIL.size :]
+            if time.monotonic() >= deadline:
+                return await fill()
+
+    async def _acquire_fill_lock(self, key: str) -> str | None:
+        token = uuid.uuid4().hex
+        acquired = await self._redis.set(f"lock:{key}", token, nx=True, px=int(settings.CACHE_FILL_LOCK_TIMEOUT * 1000))
+        return token if acquired else None
+
+    async def _store_filled(self, key: str, value: bytes, ttl: int, soft_ttl: int) -> bytes:
+        await self.set_cache(key, FRESH_UNTIL.pack(time.time() + soft_ttl) + value, pickle_dump=False, ttl=ttl)
+        return value
+
+
+async def listen_invalidations() -> None:
+    """Evict keys written by other processes from the local tier until cancelled."""
+    while True:
+        try:
+            async with Redis.from_url(settings.REDIS_URL) as redis, redis.pubsub() as pubsub:
+                await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+                # Anything cached before the subscription may have missed its invalidation
+                local_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    origin, _, key = message["data"].decode().partition(":")
+                    if origin != INSTANCE_ID:
+                        local_cache.pop(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception("Cache invalidation listener failed, reconnecting")
+            local_cache.clear()
+            await asyncio.sleep(1)
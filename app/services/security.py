@@ -5,12 +5,17 @@ from fastapi.security.http import HTTPBase
 from fastapi.security.utils import get_authorization_scheme_param
 
 import datetime
+from collections.abc import Callable
 from datetime import timedelta
+from typing import TypeVar
 
 import bcrypt
 from jose import jwt
 
 from app.core.config import settings
+from app.core.executor import ExecutorSaturated, password_executor
+
+T = TypeVar("T")
 
 
 class SecurityService:
@@ -27,15 +32,29 @@ class SecurityService:
         encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_jwt
 
-    def get_password_hash(self, password: str) -> str:
+    async def get_password_hash(self, password: str) -> str:
         pwd_bytes = password.encode("utf-8")
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(password=pwd_bytes, salt=salt)
+        salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
+        hashed_password = await self._run(bcrypt.hashpw, pwd_bytes, salt)
         return hashed_password.decode("utf-8")
 
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         password_byte_enc = plain_password.encode("utf-8")
-        return bcrypt.checkpw(password=password_byte_enc, hashed_password=hashed_password.encode("utf-8"))
+        return await self._run(bcrypt.checkpw, password_byte_enc, hashed_password.encode("utf-8"))
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Whether the hash was made with another cost factor than BCRYPT_ROUNDS ("$2b$<cost>$...")."""
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        try:
+            return await password_executor.run(func, *args)
+        except ExecutorSaturated:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={"error": "Service Unavailable", "error_description": "Too many authentication requests"},
+                headers={"Retry-After": "1"},
+            )
 
 
 class HTTPBearer(HTTPBase):
@@ -0,0 +1,267 @@
+import asyncio
+import contextlib
+import os
+import shutil
+import tempfile
+from abc import abstractmethod
+from collections.abc import AsyncIterator
+from functools import cache
+from pathlib import Path
+from typing import Protocol
+
+import anyio
+
+from app.core.config import settings
+
+CHUNK_SIZE = 64 * 1024
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class AvatarStorage(Protocol):
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def size(self, key: str) -> int | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save(self, key: str, data: bytes, content_type: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_file(self, key: str, path: Path, content_type: str) -> None:
+        """Store a local file without reading it into memory, the file may be moved away in the process."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        """Stream the object, `end` is an inclusive offset."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self) -> None:
+        raise NotImplementedError
+
+
+class LocalStorage(AvatarStorage):
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Invalid storage key {key}")
+        return path
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self._path(key).is_file)
+
+    async def size(self, key: str) -> int | None:
+        try:
+            stat = await asyncio.to_thread(os.stat, self._path(key))
+        except FileNotFoundError:
+            return None
+        return stat.st_size
+
+    async def save(self, key: str, data: bytes, content_type: str) -> None:
+        await asyncio.to_thread(self._write, self._path(key), data)
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Concurrent saves of the same key each need their own temporary file, the last rename wins
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            # mkstemp creates owner-only files, stored avatars are public
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    async def save_file(self, key: str, path: Path, content_type: str) -> None:
+        await asyncio.to_thread(self._move, path, self._path(key))
+
+    @staticmethod
+    def _move(source: Path, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        os.close(fd)
+        try:
+            # A rename within one filesystem, a copy across them, either way the key only appears once complete
+            shutil.move(source, tmp_name)
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    async def read(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        async with await anyio.open_file(self._path(key), "rb") as file:
+            await file.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await file.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._path(key).unlink, missing_ok=True)
+
+    async def close(self) -> None:
+        pass
+
+
+class S3Storage(AvatarStorage):
+    """S3-compatible storage (AWS, MinIO, moto), requires the optional `aioboto3` dependency."""
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: str | None,
+        region: str | None,
+        access_key_id: str | None,
+        secret_access_key: str | None,
+        part_size: int,
+    ) -> None:
+        try:
+            import aioboto3
+        except ImportError as exc:
+            raise RuntimeError("S3 avatar storage requires the aioboto3 package") from exc
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.part_size = part_size
+        self._session = aioboto3.Session(aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key)
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._client = None
+        self._lock = asyncio.Lock()
+
+    async def _s3(self):
+        async with self._lock:
+            if self._client is None:
+                self._client = await self._exit_stack.enter_async_context(
+                    self._session.client("s3", endpoint_url=self.endpoint_url, region_name=self.region)
+                )
+        return self._client
+
+    async def _head(self, key: str) -> dict | None:
+        from botocore.exceptions import ClientError
+
+        s3 = await self._s3()
+        try:
+            return await s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    async def exists(self, key: str) -> bool:
+        return await self._head(key) is not None
+
+    async def size(self, key: str) -> int | None:
+        head = await self._head(key)
+        return head["ContentLength"] if head else None
+
+    async def save(self, key: str, data: bytes, content_type: str) -> None:
+        await self._upload(key, content_type, len(data), _slices(data, self.part_size))
+
+    async def save_file(self, key: str, path: Path, content_type: str) -> None:
+        stat = await asyncio.to_thread(os.stat, path)
+        await self._upload(key, content_type, stat.st_size, _file_parts(path, self.part_size))
+
+    async def _upload(self, key: str, content_type: str, size: int, parts: AsyncIterator[bytes]) -> None:
+        """Store `size` bytes arriving in chunks of `part_size`, only one chunk is held in memory at a time."""
+        s3 = await self._s3()
+        if size <= self.part_size:
+            body = b"".join([part async for part in parts])
+            await s3.put_object(
+                Bucket=self.bucket, Key=key, Body=body, ContentType=content_type, CacheControl=CACHE_CONTROL
+            )
+            return
+
+        upload = await s3.create_multipart_upload(
+            Bucket=self.bucket, Key=key, ContentType=content_type, CacheControl=CACHE_CONTROL
+        )
+        upload_id = upload["UploadId"]
+        try:
+            uploaded = []
+            async for body in parts:
+                number = len(uploaded) + 1
+                part = await s3.upload_part(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+                )
+                uploaded.append({"ETag": part["ETag"], "PartNumber": number})
+            await s3.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": uploaded}
+            )
+        except BaseException:
+            await s3.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    async def read(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        s3 = await self._s3()
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = await s3.get_object(Bucket=self.bucket, Key=key, Range=byte_range)
+        body = response["Body"]
+        try:
+            async for chunk in body.iter_chunks(CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete(self, key: str) -> None:
+        s3 = await self._s3()
+        await s3.delete_object(Bucket=self.bucket, Key=key)
+
+    async def close(self) -> None:
+        await self._exit_stack.aclose()
+        self._client = None
+
+
+async def _slices(data: bytes, size: int) -> AsyncIterator[bytes]:
+    for offset in range(0, len(data), size):
+        yield data[offset : offset + size]
+
+
+async def _file_parts(path: Path, size: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as file:
+        while part := await file.read(size):
+            yield part
+
+
+@cache
+def get_avatar_storage() -> AvatarStorage:
+    if settings.AVATAR_STORAGE == "s3":
+        return S3Storage(
+            bucket=settings.S3_BUCKET,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            part_size=settings.S3_PART_SIZE,
+        )
+    return LocalStorage(root=Path(settings.AVATAR_STORAGE_PATH))
+
+
+@cache
+def get_upload_storage() -> AvatarStorage:
+    """Where uploads wait for the worker, kept out of what is publicly served.
+
+    Avatars are only served from the `avatars/` prefix of S3, so uploads share the bucket,
+    while the whole local root is served and uploads get a directory of their own.
+    """
+    if settings.AVATAR_STORAGE == "s3":
+        return get_avatar_storage()
+    return LocalStorage(root=Path(settings.AVATAR_STAGING_PATH or Path(tempfile.gettempdir()) / "avatar-staging"))
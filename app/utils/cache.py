@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class ByteLRU:
+    """In-memory LRU of byte strings bounded by entry count and total size, entries may expire after a TTL."""
+
+    def __init__(self, max_bytes: int, max_items: int | None = None) -> None:
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[str, bytes] = OrderedDict()
+        self._expires: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> bytes | None:
+        value = self._data.get(key)
+        if value is not None and key in self._expires and self._expires[key] <= time.monotonic():
+            self.pop(key)
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        self.pop(key)
+        if len(value) > self.max_bytes:
+            return
+        self._data[key] = value
+        self.size += len(value)
+        if ttl is not None:
+            self._expires[key] = time.monotonic() + ttl
+        while self.size > self.max_bytes or (self.max_items is not None and len(self._data) > self.max_items):
+            evicted_key, evicted = self._data.popitem(last=False)
+            self._expires.pop(evicted_key, None)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def pop(self, key: str) -> bytes | None:
+        value = self._data.pop(key, None)
+        if value is not None:
+            self.size -= len(value)
+            self._expires.pop(key, None)
+        return value
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._expires.clear()
+        self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "items": len(self._data),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class DiskLRU:
+    """Directory of cached byte strings bounded by total size, evicting the least recently used files."""
+
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._files: OrderedDict[str, int] | None = None
+
+    def _load(self) -> OrderedDict[str, int]:
+        if self._files is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            entries = sorted(
+                (entry for entry in os.scandir(self.path) if entry.is_file() and not entry.name.endswith(".tmp")),
+                key=lambda entry: entry.stat().st_mtime,
+            )
+            self._files = OrderedDict((entry.name, entry.stat().st_size) for entry in entries)
+            self.size = sum(self._files.values())
+        return self._files
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    async def get(self, key: str) -> bytes | None:
+        files = await asyncio.to_thread(self._load)
+        name = self._name(key)
+        if name not in files:
+            return None
+        try:
+            value = await asyncio.to_thread((self.path / name).read_bytes)
+        except FileNotFoundError:
+            self.size -= files.pop(name)
+            return None
+        files.move_to_end(name)
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        files = await asyncio.to_thread(self._load)
+        name = self._name(key)
+        evicted = []
+        if name in files:
+            self.size -= files.pop(name)
+        files[name] = len(value)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            old_name, old_size = files.popitem(last=False)
+            self.size -= old_size
+            evicted.append(old_name)
+        await asyncio.to_thread(self._write, name, value, evicted)
+
+    def _write(self, name: str, value: bytes, evicted: list[str]) -> None:
+        for old_name in evicted:
+            (self.path / old_name).unlink(missing_ok=True)
+        tmp_path = self.path / f"{name}.{os.getpid()}.tmp"
+        tmp_path.write_bytes(value)
+        os.replace(tmp_path, self.path / name)
+
+
+class SingleFlight(Generic[T]):
+    """Coalesces concurrent calls for the same key into one execution."""
+
+    def __init__(self) -> None:
+        self._inflight: dict[str, asyncio.Future[T]] = {}
+
+    async def run(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+
+class RenderCache:
+    """Memory and disk bounded cache for rendered bytes, rendering each missing key only once at a time."""
+
+    def __init__(self, memory: ByteLRU, disk: DiskLRU) -> None:
+        self.memory = memory
+        self.disk = disk
+        self._flight: SingleFlight[bytes] = SingleFlight()
+
+    async def get_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        return await self._flight.run(key, lambda: self._load(key, render))
+
+    async def _load(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        value = await self.disk.get(key)
+        if value is None:
+            value = await render()
+            await self.disk.set(key, value)
+        self.memory.set(key, value)
+        return value
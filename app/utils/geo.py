@@ -0,0 +1,77 @@
+import math
+
+from sqlalchemy import ColumnElement, and_, func, or_
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> tuple[float, float, list[tuple[float, float]]]:
+    """Latitude bounds and longitude ranges that contain every point within `radius_km` of the origin.
+
+    Longitude is split in two ranges when the box crosses the antimeridian and covers the whole
+    circle when it reaches a pole.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - math.degrees(angular)
+    max_lat = latitude + math.degrees(angular)
+    if min_lat <= -90 or max_lat >= 90 or angular >= math.pi / 2:
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    delta_lon = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(latitude))))
+    min_lon = longitude - delta_lon
+    max_lon = longitude + delta_lon
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def great_circle_km(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    """Haversine distance in kilometers between two points, the same formula as `haversine_distance`."""
+    half_lat = math.radians(other_latitude - latitude) / 2
+    half_lon = math.radians(other_longitude - longitude) / 2
+    a = math.sin(half_lat) ** 2 + math.cos(math.radians(latitude)) * math.cos(math.radians(other_latitude)) * (
+        math.sin(half_lon) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+def km_to_degrees(distance_km: float) -> float:
+    """Degrees of latitude spanned by `distance_km`, an upper bound for the same distance in longitude."""
+    return math.degrees(distance_km / EARTH_RADIUS_KM)
+
+
+def cell_center(latitude: float, longitude: float, cell_degrees: float) -> tuple[float, float]:
+    """Centre of the `cell_degrees` grid cell containing the point, rounded so it is stable as a cache key."""
+    center_lat = (math.floor(latitude / cell_degrees) + 0.5) * cell_degrees
+    center_lon = (math.floor(longitude / cell_degrees) + 0.5) * cell_degrees
+    if center_lon > 180:
+        center_lon -= 360
+    return round(min(max(center_lat, -90.0), 90.0), 6), round(center_lon, 6)
+
+
+def bounding_box_filter(
+    latitude_column, longitude_column, latitude: float, longitude: float, radius_km: float
+) -> ColumnElement[bool]:
+    min_lat, max_lat, longitude_ranges = bounding_box(latitude, longitude, radius_km)
+    return and_(
+        latitude_column.between(min_lat, max_lat),
+        or_(*(longitude_column.between(low, high) for low, high in longitude_ranges)),
+    )
+
+
+def haversine_distance(latitude_column, longitude_column, latitude: float, longitude: float) -> ColumnElement[float]:
+    """Great-circle distance in kilometers between the columns and a point."""
+    return (
+        EARTH_RADIUS_KM
+        * 2
+        * func.asin(
+            func.sqrt(
+                func.pow(func.sin((func.radians(latitude_column - latitude)) / 2), 2)
+                + func.cos(func.radians(latitude))
+                * func.cos(func.radians(latitude_column))
+                * func.pow(func.sin((func.radians(longitude_column - longitude)) / 2), 2)
+            )
+        )
+    )
@@ -0,0 +1,31 @@
+from fastapi import HTTPException, status
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+
+def encode_cursor(sort_key: str, value: datetime | float, last_id: int) -> str:
+    """Opaque cursor that points right after the row (value, last_id) of the given ordering."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort_key, value, last_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_key: str) -> tuple[datetime | float, int]:
+    invalid_cursor = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail={"error": "Bad Request", "error_description": "Invalid cursor"},
+    )
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort_key, value, last_id = json.loads(payload)
+        if cursor_sort_key != sort_key or not isinstance(last_id, int):
+            raise invalid_cursor
+        if sort_key == "created_at":
+            return datetime.fromisoformat(value), last_id
+        return float(value), last_id
+    except (binascii.Error, ValueError, TypeError):
+        raise invalid_cursor
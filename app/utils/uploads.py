@@ -0,0 +1,144 @@
+from fastapi import HTTPException, UploadFile, status
+
+import asyncio
+import logging
+import os
+import tempfile
+import uuid
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.jobs import JobQueue
+from app.services.storage import get_upload_storage
+
+UPLOADS_PREFIX = "uploads"
+# Shown until the worker has stored the watermarked avatar
+AVATAR_PLACEHOLDER = "photo_processing.jpg"
+CHUNK_SIZE = 64 * 1024
+HEADER_LIMIT = 256 * 1024
+JPEG_MAGIC = b"\xff\xd8\xff"
+# SOFn markers carry the frame size; C4, C8 and CC share the range but are DHT, JPG and DAC
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+def _bad_request(description: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail={"error": "Bad Request", "error_description": description},
+    )
+
+
+def jpeg_dimensions(header: bytes) -> tuple[int, int] | None:
+    """Read (width, height) from the SOF segment, None if the header is not complete yet."""
+    offset = 2
+    while offset + 4 <= len(header):
+        if header[offset] != 0xFF:
+            raise ValueError("Malformed JPEG segment")
+        marker = header[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError("JPEG frame header is missing")
+        if marker in SOF_MARKERS:
+            if offset + 9 > len(header):
+                return None
+            height = int.from_bytes(header[offset + 5 : offset + 7], "big")
+            width = int.from_bytes(header[offset + 7 : offset + 9], "big")
+            return width, height
+        offset += 2 + int.from_bytes(header[offset + 2 : offset + 4], "big")
+    return None
+
+
+def _check_header(header: bytes, complete: bool) -> bool:
+    """Validate the buffered header, returns True once the frame size has been checked."""
+    if len(header) >= len(JPEG_MAGIC) and not header.startswith(JPEG_MAGIC):
+        raise _bad_request("Avatar must be an image with .jpeg or .jpg extension")
+    try:
+        dimensions = jpeg_dimensions(header)
+    except ValueError:
+        raise _bad_request("Avatar is not a valid JPEG image")
+    if dimensions is None:
+        if complete:
+            raise _bad_request("Avatar is not a valid JPEG image")
+        return False
+    width, height = dimensions
+    if not width or not height or width * height > settings.AVATAR_MAX_PIXELS:
+        raise _bad_request("Avatar resolution is too large")
+    return True
+
+
+async def spool_avatar(avatar: UploadFile) -> Path:
+    """Copy an uploaded avatar to a temporary file chunk by chunk, validating it while reading."""
+    if avatar.size is not None and avatar.size > settings.AVATAR_MAX_SIZE:
+        raise _bad_request("Avatar must be less than 10mb")
+
+    fd, name = tempfile.mkstemp(suffix=".jpg", dir=settings.AVATAR_UPLOAD_DIR)
+    path = Path(name)
+    header = b""
+    validated = False
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as file:
+            while chunk := await avatar.read(CHUNK_SIZE):
+                written += len(chunk)
+                if written > settings.AVATAR_MAX_SIZE:
+                    raise _bad_request("Avatar must be less than 10mb")
+                if not validated:
+                    header += chunk[: HEADER_LIMIT - len(header)]
+                    validated = _check_header(header, complete=len(header) >= HEADER_LIMIT)
+                await run_in_threadpool(file.write, chunk)
+        if not validated:
+            _check_header(header, complete=True)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path
+
+
+async def stage_avatar(path: Path) -> str:
+    """Move a spooled avatar to the upload storage, where a worker on any host can read it, returns its key."""
+    key = f"{UPLOADS_PREFIX}/{uuid.uuid4().hex}.jpg"
+    try:
+        await get_upload_storage().save_file(key, path, "image/jpeg")
+    finally:
+        path.unlink(missing_ok=True)
+    return key
+
+
+async def hand_off_avatar(jobs: JobQueue, path: Path, user_id: int) -> None:
+    """Stage a spooled avatar and queue its processing, meant to run after the response has been sent.
+
+    Failures are only logged: the user keeps the placeholder avatar, and sending the registration again
+    with the same credentials and an avatar retries the upload.
+    """
+    try:
+        key = await stage_avatar(path)
+    except Exception:
+        logging.exception(f"Failed to stage the avatar of user {user_id}")
+        return
+    try:
+        await jobs.enqueue("avatar.process", key=key, user_id=user_id)
+    except Exception:
+        logging.exception(f"Failed to queue the avatar of user {user_id}")
+        await get_upload_storage().delete(key)
+
+
+async def fetch_avatar(key: str) -> Path:
+    """Download a staged avatar to a local temporary file for processing."""
+    fd, name = tempfile.mkstemp(suffix=".jpg", dir=settings.AVATAR_UPLOAD_DIR)
+    path = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            async for chunk in get_upload_storage().read(key):
+                await asyncio.to_thread(file.write, chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path
@@ -1,21 +1,169 @@
+import asyncio
+import hashlib
 import io
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
 
-from PIL import Image
-from sqlalchemy import update
+from PIL import Image, ImageChops
 
-from app.core.db import AsyncSessionFactory
-from app.models.user import User
+from app.core.config import settings
+from app.core.executor import image_executor
+from app.services.storage import get_avatar_storage
 
+STATIC_DIR = Path(__file__).parent.parent.parent / "static"
+AVATARS_PREFIX = "avatars"
 
-async def add_watermark(image: bytes, filename: str, user_email: str):
-    watermark = Image.open(Path(__file__).parent.parent.parent / "static" / "watermark.png")
-    image = Image.open(io.BytesIO(image))
-    width, height = image.size
-    transparent = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    transparent.paste(image, (0, 0))
-    transparent.paste(watermark, (width - watermark.size[0], height - watermark.size[1]), mask=watermark)
-    transparent.convert("RGB").save(Path(__file__).parent.parent.parent / "static" / filename)
-    async with AsyncSessionFactory() as session:
-        await session.execute(update(User).where(User.email == user_email).values(avatar=filename))
-        await session.commit()
+Image.MAX_IMAGE_PIXELS = settings.AVATAR_MAX_PIXELS
+
+# Longest side in pixels for every derivative, None keeps the original resolution
+AVATAR_SIZES: dict[str, int | None] = {"full": None, "medium": 512, "thumbnail": 128}
+AVATAR_FORMATS: dict[str, tuple[str, str, str, dict]] = {
+    "jpeg": ("JPEG", ".jpg", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", ".webp", "image/webp", {"quality": 80, "method": 4}),
+}
+
+
+@dataclass(frozen=True)
+class WatermarkVariant:
+    premultiplied: Image.Image
+    inverse_alpha: Image.Image
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.premultiplied.size
+
+
+class WatermarkAssets:
+    """Watermark decoded once per process, with premultiplied variants cached per resolution bucket."""
+
+    def __init__(self, path: Path, buckets: list[int], scale: float, max_variants: int) -> None:
+        self.path = path
+        self.buckets = sorted(buckets)
+        self.scale = scale
+        self.max_variants = max_variants
+        self._source: Image.Image | None = None
+        self._mtime: int | None = None
+        self._variants: OrderedDict[int, WatermarkVariant] = OrderedDict()
+
+    def load(self) -> None:
+        mtime = os.stat(self.path).st_mtime_ns
+        if self._source is not None and mtime == self._mtime:
+            return
+        with Image.open(self.path) as source:
+            self._source = source.convert("RGBA").convert("RGBa")
+        self._mtime = mtime
+        self._variants.clear()
+
+    def bucket_for(self, size: tuple[int, int]) -> int:
+        """The smallest bucket not below the shorter side, so the cached variant only ever gets scaled down."""
+        shortest = min(size)
+        return min((bucket for bucket in self.buckets if bucket >= shortest), default=self.buckets[-1])
+
+    def variant(self, size: tuple[int, int]) -> WatermarkVariant:
+        """Watermark `scale` times as wide as the shorter side, resized from the cached variant of its bucket."""
+        base = self._bucket_variant(self.bucket_for(size))
+        width = max(1, round(min(size) * self.scale))
+        if width == base.size[0]:
+            return base
+        height = max(1, round(base.size[1] * width / base.size[0]))
+        # Bilinear weights are convex, so resized premultiplied colours never exceed their alpha
+        return WatermarkVariant(
+            premultiplied=base.premultiplied.resize((width, height), Image.Resampling.BILINEAR),
+            inverse_alpha=base.inverse_alpha.resize((width, height), Image.Resampling.BILINEAR),
+        )
+
+    def _bucket_variant(self, bucket: int) -> WatermarkVariant:
+        self.load()
+        if bucket in self._variants:
+            self._variants.move_to_end(bucket)
+            return self._variants[bucket]
+
+        width = max(1, round(bucket * self.scale))
+        height = max(1, round(self._source.height * width / self._source.width))
+        red, green, blue, alpha = self._source.resize((width, height), Image.Resampling.LANCZOS).split()
+        inverse_alpha = ImageChops.invert(alpha)
+        variant = WatermarkVariant(
+            premultiplied=Image.merge("RGB", (red, green, blue)),
+            inverse_alpha=Image.merge("RGB", (inverse_alpha, inverse_alpha, inverse_alpha)),
+        )
+        self._variants[bucket] = variant
+        if len(self._variants) > self.max_variants:
+            self._variants.popitem(last=False)
+        return variant
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        """Composite the watermark into the bottom right corner of an RGB image."""
+        variant = self.variant(image.size)
+        width, height = image.size
+        box = (width - variant.size[0], height - variant.size[1], width, height)
+        region = image.crop(box)
+        region = ImageChops.add(ImageChops.multiply(region, variant.inverse_alpha), variant.premultiplied)
+        image.paste(region, box)
+        return image
+
+
+watermark_assets = WatermarkAssets(
+    path=STATIC_DIR / "watermark.png",
+    buckets=settings.WATERMARK_BUCKETS,
+    scale=settings.WATERMARK_SCALE,
+    max_variants=settings.WATERMARK_CACHE_SIZE,
+)
+
+
+def preload_watermark() -> None:
+    watermark_assets.load()
+
+
+def decode_avatar(path: Path, max_side: int | None) -> Image.Image:
+    """Decode an avatar, letting the JPEG decoder downscale in DCT space when a smaller size is requested."""
+    with Image.open(path) as source:
+        if max_side:
+            source.draft("RGB", (max_side, max_side))
+        decoded = source.convert("RGB")
+    if max_side:
+        decoded.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    return decoded
+
+
+def render_watermark(path: Path) -> list[tuple[str, str, str, bytes]]:
+    """Encode every derivative, returns (variant, format, content-addressed key, data) tuples."""
+    outputs = []
+    for variant, max_side in AVATAR_SIZES.items():
+        watermarked = watermark_assets.apply(decode_avatar(path, max_side))
+        for fmt, (pil_format, extension, _, options) in AVATAR_FORMATS.items():
+            buffer = io.BytesIO()
+            watermarked.save(buffer, format=pil_format, **options)
+            data = buffer.getvalue()
+            key = f"{AVATARS_PREFIX}/{hashlib.sha256(data).hexdigest()[:32]}{extension}"
+            outputs.append((variant, fmt, key, data))
+    return outputs
+
+
+def resize_avatar(data: bytes, width: int | None, height: int | None, fmt: str) -> bytes:
+    """Render a stored avatar into the requested bounding box and format, never upscaling."""
+    pil_format, _, _, options = AVATAR_FORMATS[fmt]
+    with Image.open(io.BytesIO(data)) as source:
+        bounds = (width or source.width, height or source.height)
+        source.draft("RGB", bounds)
+        image = source.convert("RGB")
+    image.thumbnail(bounds, Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+async def store_avatar(key: str, data: bytes, content_type: str) -> None:
+    storage = get_avatar_storage()
+    if not await storage.exists(key):
+        await storage.save(key, data, content_type=content_type)
+
+
+async def add_watermark(path: Path) -> dict[str, dict[str, str]]:
+    outputs = await image_executor.run(render_watermark, path)
+    await asyncio.gather(*(store_avatar(key, data, AVATAR_FORMATS[fmt][2]) for _, fmt, key, data in outputs))
+    variants: dict[str, dict[str, str]] = {}
+    for variant, fmt, key, _ in outputs:
+        variants.setdefault(variant, {})[fmt] = key
+    return variants
@@ -0,0 +1,4 @@
+from .tasks import TASKS
+from .worker import Worker
+
+__all__ = ["TASKS", "Worker"]
@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import logging
+import signal
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+from app.core.db import AsyncSessionFactory, DbConnection
+from app.core.executor import image_executor
+from app.services.jobs import JobQueue
+from app.services.like_graph import LikeGraph
+from app.services.storage import get_avatar_storage
+from app.utils.watermark import preload_watermark
+from app.worker.batching import avatar_updates
+from app.worker.likes import LikeFlusher
+from app.worker.worker import Worker
+
+
+async def main(concurrency: int) -> None:
+    image_executor.start(initializer=preload_watermark)
+    try:
+        async with Redis.from_url(settings.REDIS_URL) as redis:
+            avatar_updates.start(redis)
+            worker = Worker(JobQueue(redis), concurrency=concurrency)
+            services = [worker]
+            if settings.LIKE_GRAPH_ENABLED:
+                services.append(LikeFlusher(LikeGraph(redis)))
+
+            def stop() -> None:
+                for service in services:
+                    service.stop()
+
+            # A signal has a single handler, registering one per service would keep only the last one
+            loop = asyncio.get_running_loop()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, stop)
+            logging.info(f"Worker started with concurrency {concurrency}")
+            try:
+                await asyncio.gather(*(service.run() for service in services))
+            finally:
+                await avatar_updates.close()
+    finally:
+        await image_executor.shutdown()
+        await get_avatar_storage().close()
+
+
+async def rebuild_likes() -> None:
+    """Reload the like graph from the coincidences table, run it while the API does not record likes."""
+    async with Redis.from_url(settings.REDIS_URL) as redis:
+        connection = DbConnection(session=AsyncSessionFactory())
+        try:
+            await LikeGraph(redis).rebuild(connection)
+        finally:
+            await connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background job worker for avatar and email jobs")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    parser.add_argument("--rebuild-likes", action="store_true", help="Reload likes from Postgres into Redis and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(rebuild_likes() if args.rebuild_likes else main(args.concurrency))
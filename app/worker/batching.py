@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+from app.core.db import AsyncSessionFactory, DbConnection
+from app.daos.user import UserDao
+from app.services.redis import USERS_GENERATION, RedisService
+
+
+class AvatarUpdateBuffer:
+    """Collects finished avatar jobs and stores them with one bulk UPDATE per batch."""
+
+    def __init__(self, max_size: int, max_delay: float) -> None:
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: dict[int, dict[str, dict[str, str]]] = {}
+        self._waiters: list[asyncio.Future] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self._redis_service: RedisService | None = None
+
+    def start(self, redis: Redis) -> None:
+        """Bump the users generation after each batch through the given client."""
+        self._redis_service = RedisService(redis)
+
+    async def close(self) -> None:
+        """Store what is still buffered and wait for running flushes, call before the Redis client is closed."""
+        self._schedule_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def add(self, user_id: int, variants: dict[str, dict[str, str]]) -> None:
+        """Wait until the avatar of the user has been committed together with its batch."""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._pending[user_id] = variants
+        self._waiters.append(waiter)
+        if len(self._pending) >= self.max_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._schedule_flush)
+        await waiter
+
+    def _schedule_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        waiters, self._waiters = self._waiters, []
+        flush = asyncio.create_task(self._flush(batch, waiters))
+        # The loop only keeps weak references to tasks
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: dict[int, dict[str, dict[str, str]]], waiters: list[asyncio.Future]) -> None:
+        connection = DbConnection(session=AsyncSessionFactory())
+        try:
+            await UserDao(connection).update_avatars(batch)
+            await self._redis_service.bump_generation(USERS_GENERATION)
+        except Exception as exc:
+            logging.exception(f"Failed to store a batch of {len(batch)} avatars")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+        else:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+        finally:
+            await connection.close()
+
+
+avatar_updates = AvatarUpdateBuffer(
+    max_size=settings.AVATAR_UPDATE_BATCH_SIZE, max_delay=settings.AVATAR_UPDATE_BATCH_DELAY
+)
@@ -0,0 +1,33 @@
+import asyncio
+import contextlib
+import logging
+
+from app.core.config import settings
+from app.core.db import AsyncSessionFactory, DbConnection
+from app.services.like_graph import LikeGraph
+
+
+class LikeFlusher:
+    """Writes likes recorded in the like graph to Postgres until stopped."""
+
+    def __init__(self, graph: LikeGraph) -> None:
+        self.graph = graph
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        while not self._stopping.is_set():
+            flushed = 0
+            connection = DbConnection(session=AsyncSessionFactory())
+            try:
+                flushed = await self.graph.flush(connection)
+            except Exception:
+                logging.exception("Failed to flush likes, they stay pending")
+            finally:
+                await connection.close()
+            if flushed < settings.LIKE_GRAPH_FLUSH_BATCH_SIZE:
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.LIKE_GRAPH_FLUSH_INTERVAL)
+        # Whatever is still pending at shutdown is written by the next flusher
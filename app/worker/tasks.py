@@ -0,0 +1,37 @@
+from collections.abc import Awaitable, Callable
+
+from app.services.emails import EmailService
+from app.services.storage import get_upload_storage
+from app.utils.uploads import fetch_avatar
+from app.utils.watermark import add_watermark
+from app.worker.batching import avatar_updates
+
+
+async def process_avatar(key: str, user_id: int) -> None:
+    path = await fetch_avatar(key)
+    try:
+        variants = await add_watermark(path)
+    finally:
+        path.unlink(missing_ok=True)
+    await avatar_updates.add(user_id, variants)
+    # the staged upload is kept until the job succeeds so retries can read it again
+    await discard_avatar(key, user_id)
+
+
+async def discard_avatar(key: str, user_id: int) -> None:
+    await get_upload_storage().delete(key)
+
+
+async def send_email(email_to: str | list[str], subject: str = "", html_content: str = "") -> None:
+    await EmailService().send_email(email_to=email_to, subject=subject, html_content=html_content)
+
+
+TASKS: dict[str, Callable[..., Awaitable[None]]] = {
+    "avatar.process": process_avatar,
+    "email.send": send_email,
+}
+
+# Run with the job arguments when a job is moved to the dead-letter list, to release what it holds
+CLEANUPS: dict[str, Callable[..., Awaitable[None]]] = {
+    "avatar.process": discard_avatar,
+}
@@ -0,0 +1,104 @@
+import asyncio
+import contextlib
+import logging
+
+from app.core.config import settings
+from app.services.jobs import Job, JobQueue
+from app.worker.tasks import CLEANUPS, TASKS
+
+
+class Worker:
+    def __init__(self, queue: JobQueue, concurrency: int) -> None:
+        self.queue = queue
+        self.concurrency = concurrency
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        running: set[asyncio.Task] = set()
+
+        def _done(task: asyncio.Task) -> None:
+            running.discard(task)
+            slots.release()
+
+        while not self._stopping.is_set():
+            await slots.acquire()
+            try:
+                job = await self.queue.reserve()
+            except Exception:
+                logging.exception("Failed to reserve a job, retrying")
+                job = None
+            if job is None:
+                slots.release()
+                await self._wait(settings.JOB_POLL_INTERVAL)
+                continue
+            task = asyncio.create_task(self._handle(job))
+            running.add(task)
+            task.add_done_callback(_done)
+
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def _handle(self, job: Job) -> None:
+        if self.queue.exhausted(job):
+            logging.error(f"Job {job.id} ({job.task}) was delivered {job.deliveries} times without finishing")
+            try:
+                await self.queue.bury(job, "Worker stopped while running the job")
+                await self._cleanup(job)
+            except Exception:
+                logging.exception(f"Failed to bury job {job.id} ({job.task})")
+            return
+
+        handler = TASKS.get(job.task)
+        if handler is None:
+            logging.error(f"Unknown job task {job.task}, moving job {job.id} to the dead-letter list")
+            try:
+                await self.queue.bury(job, f"Unknown task {job.task}")
+            except Exception:
+                logging.exception(f"Failed to bury job {job.id} ({job.task})")
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await handler(**job.kwargs)
+        except Exception as exc:
+            logging.exception(f"Job {job.id} ({job.task}) failed on attempt {job.attempts + 1}")
+            error = repr(exc)
+        else:
+            error = None
+        finally:
+            heartbeat.cancel()
+
+        # A job left unsettled here is picked up again once its visibility timeout runs out
+        try:
+            if error is None:
+                await self.queue.ack(job)
+            elif not await self.queue.retry(job, error):
+                await self._cleanup(job)
+        except Exception:
+            logging.exception(f"Failed to settle job {job.id} ({job.task})")
+
+    async def _wait(self, timeout: float) -> None:
+        """Sleep for `timeout` seconds unless the worker is stopped first."""
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._stopping.wait(), timeout=timeout)
+
+    async def _cleanup(self, job: Job) -> None:
+        cleanup = CLEANUPS.get(job.task)
+        if cleanup is None:
+            return
+        try:
+            await cleanup(**job.kwargs)
+        except Exception:
+            logging.exception(f"Failed to clean up after dead job {job.id} ({job.task})")
+
+    async def _heartbeat(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(settings.JOB_VISIBILITY_TIMEOUT / 3)
+            try:
+                await self.queue.touch(job)
+            except Exception:
+                logging.exception(f"Failed to extend the visibility timeout of job {job.id}")
@@ -0,0 +1,11 @@
+import os
+
+# Settings are read on import, the tests only need the variables without defaults
+for name, value in {
+    "PROJECT_NAME": "test",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "postgres",
+    "REDIS_HOST": "localhost",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,69 @@
+import pytest
+from starlette.requests import Request
+
+from app.routers.avatars import _not_modified, _parse_range, _resolve_range
+
+
+def _request(**headers: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"xyz", W/"abc"', True),
+        ("*", True),
+        ('"xyz"', False),
+        ('W/"xyz"', False),
+    ],
+)
+def test_if_none_match_uses_weak_comparison(if_none_match, expected):
+    assert _not_modified(_request(if_none_match=if_none_match), '"abc"') is expected
+
+
+def test_missing_if_none_match_is_modified():
+    assert _not_modified(_request(), '"abc"') is False
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 9)),
+        ("bytes=90-", (90, None)),
+        ("bytes=-5", (None, 5)),
+        (" bytes = 3-1000 ", (3, 1000)),
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+        ("bytes=5-2", None),
+        ("bytes=x-1", None),
+        ("bytes=-", None),
+        ("bytes=5", None),
+        ("bytes=-1-2", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert _parse_range(header) == expected
+
+
+@pytest.mark.parametrize(
+    "first, last, expected",
+    [
+        (0, 9, (0, 9)),
+        (90, None, (90, 99)),
+        (3, 1000, (3, 99)),
+        (None, 5, (95, 99)),
+        (None, 500, (0, 99)),
+        (None, 0, None),
+        (100, None, None),
+        (150, 200, None),
+    ],
+)
+def test_resolve_range_against_the_size(first, last, expected):
+    assert _resolve_range(first, last, 100) == expected
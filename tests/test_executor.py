@@ -0,0 +1,31 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.core.executor import ImageExecutor
+
+
+def _square(value: int) -> int:
+    return value * value
+
+
+def _die() -> None:
+    # What the OOM killer does to a worker decoding a huge image
+    os._exit(1)
+
+
+def test_image_executor_recovers_from_a_dead_worker():
+    async def scenario():
+        executor = ImageExecutor(max_workers=1, max_queue=1)
+        executor.start()
+        try:
+            assert await executor.run(_square, 3) == 9
+            with pytest.raises(BrokenProcessPool):
+                await executor.run(_die)
+            assert await executor.run(_square, 4) == 16
+        finally:
+            await executor.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+import pytest
+
+from app.utils.geo import bounding_box, cell_center, great_circle_km, km_to_degrees
+
+
+def test_bounding_box_away_from_edges():
+    min_lat, max_lat, ranges = bounding_box(55.75, 37.62, 100)
+    assert min_lat == pytest.approx(55.75 - km_to_degrees(100))
+    assert max_lat == pytest.approx(55.75 + km_to_degrees(100))
+    [(low, high)] = ranges
+    assert low < 37.62 < high
+    # A degree of longitude is shorter than one of latitude away from the equator
+    assert high - 37.62 > max_lat - 55.75
+
+
+@pytest.mark.parametrize("longitude", [179.9, -179.9])
+def test_bounding_box_splits_at_the_antimeridian(longitude):
+    min_lat, max_lat, ranges = bounding_box(0.0, longitude, 50)
+    assert len(ranges) == 2
+    (east_low, east_high), (west_low, west_high) = ranges
+    assert east_high == 180.0 and west_low == -180.0
+    assert 170 < east_low < 180 and -180 < west_high < -170
+    assert any(low <= longitude <= high for low, high in ranges)
+
+
+@pytest.mark.parametrize("latitude", [89.9, -89.9])
+def test_bounding_box_covers_every_longitude_at_the_poles(latitude):
+    min_lat, max_lat, ranges = bounding_box(latitude, 10.0, 50)
+    assert ranges == [(-180.0, 180.0)]
+    assert -90.0 <= min_lat < max_lat <= 90.0
+    assert 90.0 in (max_lat, -min_lat)
+
+
+def test_bounding_box_of_a_hemisphere_covers_everything():
+    assert bounding_box(0.0, 0.0, 10_100) == (-90.0, 90.0, [(-180.0, 180.0)])
+
+
+def test_points_in_range_fall_into_the_box():
+    origin = (60.0, 179.5)
+    min_lat, max_lat, ranges = bounding_box(*origin, 100)
+    for point in [(60.5, 179.9), (60.0, -179.8), (59.2, 179.0), (60.8, 179.5)]:
+        assert great_circle_km(*origin, *point) <= 100
+        assert min_lat <= point[0] <= max_lat
+        assert any(low <= point[1] <= high for low, high in ranges)
+
+
+def test_great_circle_distance():
+    assert great_circle_km(55.7558, 37.6173, 59.9343, 30.3351) == pytest.approx(634, abs=2)
+    assert great_circle_km(0.0, 179.9, 0.0, -179.9) == pytest.approx(22.24, abs=0.01)
+    assert great_circle_km(10.0, 20.0, 10.0, 20.0) == 0.0
+
+
+def test_cell_center_is_shared_within_a_cell():
+    assert cell_center(55.71, 37.61, 0.5) == cell_center(55.99, 37.99, 0.5) == (55.75, 37.75)
+    assert cell_center(-0.1, -179.9, 1.0) == (-0.5, -179.5)
+    assert cell_center(89.9, 179.9, 1.0) == (89.5, 179.5)
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.services.geo_index import GeoIndex  # noqa: E402
+
+CREATED = datetime(2024, 1, 1)
+USERS = [
+    # id, latitude, longitude, created_at, gender, first_name, last_name
+    (1, 55.75, 37.62, CREATED, "мужчина", "Ivan", "Petrov"),
+    (2, 55.76, 37.60, CREATED + timedelta(days=1), "женщина", "Anna_Maria", "Smirnova"),
+    (3, 55.80, 37.70, CREATED + timedelta(days=2), "мужчина", "100%", "Ivanov"),
+    (4, 59.94, 30.31, CREATED + timedelta(days=3), "женщина", "Olga", "Ivanova"),
+    (5, 55.75, 179.99, CREATED + timedelta(days=4), "мужчина", "East", "Side"),
+    (6, 55.75, -179.99, CREATED + timedelta(days=5), "женщина", "West", "Side"),
+]
+
+
+class Rows:
+    def __init__(self, rows) -> None:
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class Session:
+    def __init__(self, rows) -> None:
+        self.rows = rows
+
+    async def execute(self, statement):
+        return Rows(self.rows)
+
+
+@pytest.fixture(params=[0, 1], ids=["sorted", "tail"])
+def index(request):
+    index = GeoIndex(cell_degrees=1.0, refresh_interval=5.0, max_tail=request.param * len(USERS))
+    asyncio.run(index.refresh(Session(USERS)))
+    return index
+
+
+def test_index_is_ready_after_the_first_refresh():
+    index = GeoIndex(cell_degrees=1.0, refresh_interval=5.0, max_tail=10)
+    assert not index.ready
+    asyncio.run(index.refresh(Session([])))
+    assert index.ready
+
+
+def test_search_by_radius_and_filters(index):
+    assert sorted(index.search(55.75, 37.62, 20)["id"].tolist()) == [1, 2, 3]
+    assert index.search(55.75, 37.62, 20, gender="женщина")["id"].tolist() == [2]
+    assert sorted(index.search(55.75, 37.62, 1000, last_name="IVANOV")["id"].tolist()) == [3, 4]
+
+
+def test_name_wildcards_match_literally(index):
+    assert index.search(55.75, 37.62, 20, first_name="%")["id"].tolist() == [3]
+    assert index.search(55.75, 37.62, 20, first_name="a_m")["id"].tolist() == [2]
+    assert index.search(55.75, 37.62, 20, first_name="a%a")["id"].tolist() == []
+
+
+def test_search_across_the_antimeridian(index):
+    assert sorted(index.search(55.75, 179.99, 10)["id"].tolist()) == [5, 6]
+
+
+def test_page_by_distance_with_keyset(index):
+    matches = index.search(55.75, 37.62, 1000)
+    ids, distances = index.page(matches, "distance", None, limit=2, offset=0)
+    assert ids == [1, 2]
+    assert distances == sorted(distances)
+    rest, _ = index.page(matches, "distance", None, limit=10, offset=0, after=(distances[-1], ids[-1]))
+    assert rest == [3, 4]
+
+
+def test_page_by_registration_date(index):
+    matches = index.search(55.75, 37.62, 1000)
+    assert index.page(matches, "created_at", "desc", limit=2, offset=1)[0] == [3, 2]
+    assert index.page(matches, "created_at", "asc", limit=10, offset=0, after=(CREATED, 1))[0] == [2, 3, 4]
@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.services.jobs import JobQueue
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(fakeredis.FakeAsyncRedis())
+
+
+def test_reserve_hides_the_job_until_it_is_acked(queue):
+    async def scenario():
+        await queue.enqueue("email.send", email_to="a@example.com")
+        job = await queue.reserve()
+        hidden = await queue.reserve()
+        await queue.ack(job)
+        keys = await queue._redis.keys("*")
+        return job, hidden, keys
+
+    job, hidden, keys = asyncio.run(scenario())
+    assert (job.task, job.kwargs, job.deliveries) == ("email.send", {"email_to": "a@example.com"}, 1)
+    assert hidden is None
+    assert keys == []
+
+
+def test_failed_job_is_retried_then_buried(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF", 0)
+
+    async def scenario():
+        await queue.enqueue("avatar.process", key="uploads/a.jpg", user_id=1)
+        first = await queue.reserve()
+        retried = await queue.retry(first, "ValueError()")
+        second = await queue.reserve()
+        redelivered = (second.id, second.attempts, second.deliveries)
+        buried = await queue.retry(second, "ValueError()")
+        return first, redelivered, retried, buried, await queue._redis.lrange(queue.dead_key, 0, -1)
+
+    first, redelivered, retried, buried, dead = asyncio.run(scenario())
+    assert redelivered == (first.id, 1, 2)
+    assert (retried, buried) == (True, False)
+    assert [json.loads(entry)["attempts"] for entry in dead] == [2]
+
+
+def test_job_that_keeps_killing_its_worker_is_exhausted(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 3)
+    # Every reservation expires at once, as if each worker died while running the job
+    monkeypatch.setattr(settings, "JOB_VISIBILITY_TIMEOUT", -1)
+
+    async def scenario():
+        await queue.enqueue("avatar.process", key="uploads/a.jpg", user_id=1)
+        return [await queue.reserve() for _ in range(4)]
+
+    deliveries = asyncio.run(scenario())
+    assert [job.deliveries for job in deliveries] == [1, 2, 3, 4]
+    assert [queue.exhausted(job) for job in deliveries] == [False, False, False, True]
+    assert all(job.attempts == 0 for job in deliveries)
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.services import like_graph
+from app.services.like_graph import LikeGraph
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class RecordingDao:
+    stored: list[tuple[list, list]] = []
+    during_write = None
+
+    def __init__(self, db_connection) -> None:
+        pass
+
+    async def create_many(self, likes, matches) -> None:
+        if RecordingDao.during_write is not None:
+            await RecordingDao.during_write()
+        RecordingDao.stored.append((likes, matches))
+
+
+@pytest.fixture
+def dao(monkeypatch):
+    RecordingDao.stored = []
+    RecordingDao.during_write = None
+    monkeypatch.setattr(like_graph, "CoincidenceDao", RecordingDao)
+    return RecordingDao
+
+
+def test_likes_become_mutual_once():
+    async def scenario():
+        graph = LikeGraph(fakeredis.FakeAsyncRedis())
+        return [
+            await graph.like(1, 2),
+            await graph.like(2, 1),
+            await graph.like(2, 1),
+            await graph.like_many(3, [1, 2]),
+            await graph.like_many(1, [3, 4]),
+        ]
+
+    assert asyncio.run(scenario()) == [False, True, False, [], [3]]
+
+
+def test_flush_stores_and_trims_the_batch(dao):
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        graph = LikeGraph(redis)
+        await graph.like(1, 2)
+        await graph.like(2, 1)
+        flushed = await graph.flush(db_connection=None)
+        return flushed, await redis.llen(graph.pending_key), await redis.exists(graph.lock_key)
+
+    assert asyncio.run(scenario()) == (2, 0, 0)
+    assert dao.stored == [([(1, 2), (2, 1)], [(1, 2)])]
+
+
+def test_flush_that_lost_its_lock_keeps_the_entries(dao):
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        graph = LikeGraph(redis)
+        await graph.like(1, 2)
+
+        async def lock_expires():
+            # Another flusher took over after the lock expired and queued likes arrived meanwhile
+            await redis.set(graph.lock_key, "other")
+            await graph.like(3, 4)
+
+        dao.during_write = lock_expires
+        await graph.flush(db_connection=None)
+        return await redis.lrange(graph.pending_key, 0, -1), await redis.get(graph.lock_key)
+
+    pending, lock = asyncio.run(scenario())
+    assert pending == [b"1:2:0", b"3:4:0"]
+    assert lock == b"other"
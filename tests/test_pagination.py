@@ -0,0 +1,39 @@
+from fastapi import HTTPException
+
+from datetime import UTC, datetime
+
+import pytest
+
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize(
+    "sort_key, value",
+    [
+        ("created_at", datetime(2024, 3, 10, 12, 30, 15, 123456)),
+        ("created_at", datetime(2024, 3, 10, 12, 30, tzinfo=UTC)),
+        ("distance", 12.345678901),
+        ("distance", 0.0),
+    ],
+)
+def test_cursor_round_trip(sort_key, value):
+    cursor = encode_cursor(sort_key, value, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, sort_key) == (value, 42)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        encode_cursor("distance", 1.5, 42),
+        "not a cursor",
+        "bm90IGpzb24",
+        encode_cursor("created_at", "yesterday", 42),
+        encode_cursor("created_at", datetime(2024, 3, 10), "42"),
+    ],
+    ids=["other-ordering", "not-base64", "not-json", "bad-date", "bad-id"],
+)
+def test_invalid_cursor_is_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, "created_at")
+    assert error.value.status_code == 400
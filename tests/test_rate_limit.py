@@ -0,0 +1,124 @@
+import asyncio
+from datetime import UTC, datetime
+
+import pytest
+
+from app.services import rate_limit
+from app.services.rate_limit import RateLimiter, local_day
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class Clock:
+    def __init__(self, now: float) -> None:
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1_000_000.0)
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiter():
+    return RateLimiter(fakeredis.FakeAsyncRedis())
+
+
+def test_fixed_window_grants_up_to_the_limit(limiter):
+    async def scenario():
+        return [await limiter.fixed_window("user", limit=3, window=60) for _ in range(4)]
+
+    results = asyncio.run(scenario())
+    assert [result.granted for result in results] == [1, 1, 1, 0]
+    assert [result.remaining for result in results] == [2, 1, 0, 0]
+    assert 59 < results[-1].reset_after <= 60
+    assert "Retry-After" not in results[0].headers
+    assert results[-1].headers["Retry-After"] == "60"
+    assert results[-1].headers["X-RateLimit-Limit"] == "3"
+
+
+def test_fixed_window_cost_and_partial(limiter):
+    async def scenario():
+        return [
+            await limiter.fixed_window("user", limit=5, window=60, cost=4),
+            await limiter.fixed_window("user", limit=5, window=60, cost=2),
+            await limiter.fixed_window("user", limit=5, window=60, cost=2, partial=True),
+            await limiter.fixed_window("user", limit=5, window=60, cost=1, partial=True),
+        ]
+
+    all_or_nothing_first, denied, partial, exhausted = asyncio.run(scenario())
+    assert (all_or_nothing_first.granted, all_or_nothing_first.used) == (4, 4)
+    assert (denied.granted, denied.used, denied.allowed) == (0, 4, False)
+    assert (partial.granted, partial.used, partial.requested) == (1, 5, 2)
+    assert "Retry-After" in partial.headers
+    assert exhausted.granted == 0
+
+
+def test_sliding_window_weighs_the_previous_window(limiter, clock):
+    async def scenario():
+        clock.now = 1000.0
+        first = [await limiter.sliding_window("user", limit=4, window=10) for _ in range(4)]
+        # Halfway through the next window half of the previous one still counts
+        clock.now = 1015.0
+        strict = await limiter.sliding_window("user", limit=4, window=10, cost=3)
+        partial = await limiter.sliding_window("user", limit=4, window=10, cost=3, partial=True)
+        clock.now = 1030.0
+        later = await limiter.sliding_window("user", limit=4, window=10, cost=4)
+        return first, strict, partial, later
+
+    first, strict, partial, later = asyncio.run(scenario())
+    assert [result.granted for result in first] == [1, 1, 1, 1]
+    assert (strict.granted, strict.used, strict.reset_after) == (0, 2, 5.0)
+    assert (partial.granted, partial.used) == (2, 4)
+    assert later.granted == 4
+
+
+def test_token_bucket_refills_over_time(limiter, clock):
+    async def scenario():
+        drained = await limiter.token_bucket("user", capacity=5, refill_rate=1, cost=5)
+        empty = await limiter.token_bucket("user", capacity=5, refill_rate=1)
+        clock.now += 2.5
+        strict = await limiter.token_bucket("user", capacity=5, refill_rate=1, cost=3)
+        partial = await limiter.token_bucket("user", capacity=5, refill_rate=1, cost=3, partial=True)
+        clock.now += 100
+        full = await limiter.token_bucket("user", capacity=5, refill_rate=1, cost=5)
+        return drained, empty, strict, partial, full
+
+    drained, empty, strict, partial, full = asyncio.run(scenario())
+    assert (drained.granted, drained.remaining, drained.reset_after) == (5, 0, 1.0)
+    assert (empty.granted, empty.reset_after) == (0, 1.0)
+    assert (strict.granted, strict.remaining) == (0, 2)
+    assert (partial.granted, partial.remaining, partial.reset_after) == (2, 0, 0.5)
+    assert full.granted == 5
+
+
+@pytest.mark.parametrize(
+    "longitude, day, seconds_left",
+    [
+        (0.0, "2024-03-10", 30 * 60),
+        (None, "2024-03-10", 30 * 60),
+        (45.0, "2024-03-11", 21.5 * 3600),
+        (-120.0, "2024-03-10", 8.5 * 3600),
+        (7.4, "2024-03-10", 30 * 60),
+        (7.6, "2024-03-11", 23.5 * 3600),
+    ],
+)
+def test_local_day_follows_the_solar_offset(longitude, day, seconds_left):
+    now = datetime(2024, 3, 10, 23, 30, tzinfo=UTC)
+    assert local_day(longitude, now) == (day, seconds_left)
+
+
+def test_daily_quota_is_kept_per_local_day(limiter, monkeypatch):
+    monkeypatch.setattr(rate_limit, "local_day", lambda longitude: ("2024-03-10", 1800.0))
+
+    async def scenario():
+        return [await limiter.daily("match:1", limit=2, longitude=0.0) for _ in range(3)]
+
+    results = asyncio.run(scenario())
+    assert [result.granted for result in results] == [1, 1, 0]
+    assert 1799 < results[-1].reset_after <= 1800
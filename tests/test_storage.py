@@ -0,0 +1,97 @@
+import asyncio
+import os
+import stat
+
+import pytest
+
+from app.services.storage import LocalStorage, S3Storage
+
+
+async def _read(storage, key: str, start: int = 0, end: int | None = None) -> bytes:
+    return b"".join([chunk async for chunk in storage.read(key, start, end)])
+
+
+def test_local_save_file_moves_the_file(tmp_path):
+    storage = LocalStorage(root=tmp_path / "root")
+    upload = tmp_path / "upload.jpg"
+    upload.write_bytes(b"avatar")
+
+    asyncio.run(storage.save_file("uploads/a.jpg", upload, "image/jpeg"))
+
+    stored = tmp_path / "root" / "uploads" / "a.jpg"
+    assert stored.read_bytes() == b"avatar"
+    assert stat.S_IMODE(os.stat(stored).st_mode) == 0o644
+    assert not upload.exists()
+    assert [path.name for path in stored.parent.iterdir()] == ["a.jpg"]
+
+
+def test_local_rejects_keys_outside_the_root(tmp_path):
+    storage = LocalStorage(root=tmp_path)
+    with pytest.raises(ValueError):
+        asyncio.run(storage.save("../escape.jpg", b"x", "image/jpeg"))
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    pytest.importorskip("aioboto3")
+    server_module = pytest.importorskip("moto.server")
+    server = server_module.ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+def _s3_storage(endpoint: str, bucket: str) -> S3Storage:
+    return S3Storage(
+        bucket=bucket,
+        endpoint_url=endpoint,
+        region="us-east-1",
+        access_key_id="test",
+        secret_access_key="test",
+        # The smallest part S3 accepts for all but the last part
+        part_size=5 * 1024 * 1024,
+    )
+
+
+@pytest.mark.parametrize("size", [1024, 11 * 1024 * 1024], ids=["single", "multipart"])
+def test_s3_save_file_round_trip(s3_endpoint, tmp_path, size):
+    data = os.urandom(size)
+    upload = tmp_path / "upload.jpg"
+    upload.write_bytes(data)
+
+    async def scenario():
+        storage = _s3_storage(s3_endpoint, f"avatars-{size}")
+        try:
+            s3 = await storage._s3()
+            await s3.create_bucket(Bucket=storage.bucket)
+            await storage.save_file("uploads/a.jpg", upload, "image/jpeg")
+            assert await storage.size("uploads/a.jpg") == size
+            assert await _read(storage, "uploads/a.jpg") == data
+            assert await _read(storage, "uploads/a.jpg", 10, 19) == data[10:20]
+            head = await s3.head_object(Bucket=storage.bucket, Key="uploads/a.jpg")
+            assert head["ContentType"] == "image/jpeg"
+            await storage.delete("uploads/a.jpg")
+            assert not await storage.exists("uploads/a.jpg")
+        finally:
+            await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_s3_save_bytes_in_parts(s3_endpoint):
+    data = os.urandom(6 * 1024 * 1024)
+
+    async def scenario():
+        storage = _s3_storage(s3_endpoint, "avatars-bytes")
+        try:
+            s3 = await storage._s3()
+            await s3.create_bucket(Bucket=storage.bucket)
+            await storage.save("avatars/a.jpg", data, "image/jpeg")
+            assert await _read(storage, "avatars/a.jpg") == data
+            uploads = await s3.list_multipart_uploads(Bucket=storage.bucket)
+            assert not uploads.get("Uploads")
+        finally:
+            await storage.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,92 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.services.jobs import JobQueue
+from app.services.storage import get_upload_storage
+from app.utils.uploads import fetch_avatar, hand_off_avatar, jpeg_dimensions
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def staging(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "AVATAR_STORAGE", "local")
+    monkeypatch.setattr(settings, "AVATAR_STAGING_PATH", str(tmp_path / "staging"))
+    get_upload_storage.cache_clear()
+    yield tmp_path / "staging"
+    get_upload_storage.cache_clear()
+
+
+@pytest.fixture
+def spooled(tmp_path):
+    path = tmp_path / "spooled.jpg"
+    path.write_bytes(b"\xff\xd8\xff avatar")
+    return path
+
+
+def test_hand_off_stages_and_queues_the_upload(staging, spooled):
+    async def scenario():
+        queue = JobQueue(fakeredis.FakeAsyncRedis())
+        await hand_off_avatar(queue, spooled, user_id=7)
+        job = await queue.reserve()
+        fetched = await fetch_avatar(job.kwargs["key"])
+        try:
+            return job, fetched.read_bytes()
+        finally:
+            fetched.unlink()
+
+    job, data = asyncio.run(scenario())
+
+    assert job.task == "avatar.process"
+    assert job.kwargs["user_id"] == 7
+    assert (staging / job.kwargs["key"]).is_file()
+    assert data == b"\xff\xd8\xff avatar"
+    assert not spooled.exists()
+
+
+def test_failed_enqueue_discards_the_staged_upload(staging, spooled):
+    class UnavailableQueue:
+        async def enqueue(self, task: str, **kwargs):
+            raise ConnectionError("queue is down")
+
+    asyncio.run(hand_off_avatar(UnavailableQueue(), spooled, user_id=7))
+
+    assert not spooled.exists()
+    assert not list(staging.rglob("*.jpg"))
+
+
+def _jpeg(size: tuple[int, int], **options) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 100, 50)).save(buffer, format="JPEG", **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"progressive": True}, {"exif": b"Exif\x00\x00" + b"\x00" * 2048}, {"icc_profile": b"\x00" * 4096}],
+    ids=["baseline", "progressive", "exif", "icc"],
+)
+def test_jpeg_dimensions_reads_the_frame_header(options):
+    assert jpeg_dimensions(_jpeg((321, 123), **options)) == (321, 123)
+
+
+def test_jpeg_dimensions_waits_for_a_complete_header():
+    data = _jpeg((64, 48), exif=b"Exif\x00\x00" + b"\x00" * 2048)
+    frame = data.index(b"\xff\xc0")
+    assert jpeg_dimensions(data[:frame]) is None
+    assert jpeg_dimensions(data[: frame + 8]) is None
+    assert jpeg_dimensions(data[: frame + 9]) == (64, 48)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [b"\xff\xd8\x00\x00\x00\x00", b"\xff\xd8\xff\xda\x00\x08", b"\xff\xd8\xff\xd9\x00\x00"],
+    ids=["not-a-marker", "scan-before-frame", "end-before-frame"],
+)
+def test_jpeg_dimensions_rejects_malformed_headers(header):
+    with pytest.raises(ValueError):
+        jpeg_dimensions(header)
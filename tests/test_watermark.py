@@ -0,0 +1,33 @@
+import pytest
+from PIL import Image
+
+from app.utils.watermark import WatermarkAssets
+
+
+@pytest.fixture
+def assets(tmp_path):
+    path = tmp_path / "watermark.png"
+    Image.new("RGBA", (400, 100), (255, 255, 255, 128)).save(path)
+    return WatermarkAssets(path=path, buckets=[256, 512, 1024, 2048], scale=0.25, max_variants=2)
+
+
+@pytest.mark.parametrize("shortest", [100, 255, 256, 257, 1023, 1024, 1025, 2000, 3000])
+def test_watermark_width_follows_the_shorter_side(assets, shortest):
+    variant = assets.variant((shortest, shortest * 2))
+    assert variant.size == (round(shortest * 0.25), round(shortest * 0.25 / 4))
+
+
+def test_variants_are_cached_per_bucket(assets):
+    assets.variant((300, 300))
+    assets.variant((400, 400))
+    assets.variant((2000, 2000))
+    assets.variant((3000, 3000))
+    assert list(assets._variants) == [512, 2048]
+
+
+def test_apply_blends_into_the_bottom_right_corner(assets):
+    image = Image.new("RGB", (800, 600), (0, 0, 0))
+    assets.apply(image)
+    assert image.getpixel((799, 599)) == (128, 128, 128)
+    assert image.getpixel((0, 0)) == (0, 0, 0)
+    assert image.getpixel((799, 599 - 38)) == (0, 0, 0)